@@ -2,24 +2,93 @@
 # --- IMPORTS (standard, then third party, then my own modules)
 # -------------------------------------------------------------------------------
 import matplotlib
+import pickle
 import pprint
+import re
+import sys
+from bisect import bisect_left
+from functools import partial
 from collections import namedtuple, OrderedDict
+from multiprocessing.pool import ThreadPool
 from colorama import Fore
-from copy import deepcopy
 import pandas
 import cv2
 from numpy import inf
-from scipy.optimize import least_squares
-from scipy.sparse import lil_matrix
+from scipy.optimize import least_squares, OptimizeResult
+# approx_derivative and group_columns are private helpers of scipy (used by least_squares), so their signatures may
+# change between scipy versions. Used with scipy 1.2.
+from scipy.optimize._numdiff import approx_derivative, group_columns
+from scipy.sparse import coo_matrix, csc_matrix, csr_matrix, diags, issparse
+from scipy.sparse.linalg import splu
 import numpy as np
-import random
-import KeyPressManager
+from . import KeyPressManager
+try:
+    import h5py  # optional, used to export problems to HDF5 files
+except ImportError:
+    h5py = None
+from .lie_groups import so3_right_jacobian_inverse
+from .ParallelUtils import SharedArray, WorkerPool
+from .utilities import rodriguesToMatrixBatch, matrixToRodriguesBatch
 import time
 
 # ------------------------
 # DATA STRUCTURES   ##
 # ------------------------
 ParamT = namedtuple('ParamT', 'param_names idx data_key getter setter bound_max bound_min')
+ResidualBlockT = namedtuple('ResidualBlockT', 'name_template first_index number_of_residuals params row')
+ObjectiveBlockT = namedtuple('ObjectiveBlockT', 'handle residuals')
+ManifoldT = namedtuple('ManifoldT', 'getter setter is_pose rotation_ref x_ref')
+
+# Attributes with figures and windows, which are not copied when the Optimizer is pickled
+VISUALIZATION_ATTRIBUTES = ['figures', 'wm', 'figure_residuals', 'ax', 'initial_residuals_handle', 'plot_handle',
+                            'figure_error_evolution', 'error_ax', 'error_plot_handle']
+
+BUDGET_EXHAUSTED = -10  # status of the optimization result when the solver is stopped by the budget
+
+
+class BudgetExhausted(Exception):
+    """ Raised by the objective function wrapper to stop the solver when the time or evaluation budget is used. """
+    pass
+
+
+def _encodeStrings(strings):
+    return np.array([string.encode('utf-8') for string in strings], dtype=np.bytes_)
+
+
+def _decodeStrings(array):
+    return [str(string.decode('utf-8')) for string in array.tolist()]
+
+
+def checkImportable(handle, description):
+    """ Raises ValueError if a function cannot be found by its module and name, which is how pickle sends functions.
+
+    :param handle: a function, or a functools.partial of a function.
+    :param description: what the function is, used in the error message.
+    """
+    if isinstance(handle, partial):
+        handle = handle.func
+    if getattr(handle, '__self__', None) is not None or not hasattr(handle, '__name__'):
+        return  # bound methods and callable objects are pickled with their object
+
+    found = sys.modules.get(handle.__module__)
+    for name in getattr(handle, '__qualname__', handle.__name__).split('.'):
+        found = getattr(found, name, None)
+
+    if found is not handle:
+        raise ValueError(description + ' ' + Fore.RED + handle.__name__ + Fore.RESET + ' from module ' +
+                         str(handle.__module__) + ' cannot be pickled. Use a function defined at module level instead '
+                                                  'of a lambda or a nested function.')
+
+
+def _evaluateInWorker(optimizer, task):
+    """ Evaluates the residuals at x in a worker process of the Optimizer's worker pool. """
+    x, (manifold_state, block_subsets, active_rows) = task
+    optimizer._setManifoldState(manifold_state)
+    optimizer._block_subsets, optimizer._active_rows = block_subsets, active_rows
+    optimizer.x = x
+    optimizer.fromXToData()
+    return optimizer.errorDictToList(optimizer.objective_function(optimizer.data_models))
+
 
 def tic():
     # matlab like tic and toc functions
@@ -66,7 +135,92 @@ def addArguments(ap):
 data_models = []
 
 
-class Optimizer:
+class OptimizationResult(object):
+    """ The result of an optimization. Gives access to the scipy result (e.g. result.x, result.jac, result['message'])
+    and keeps a recording of the accepted iterations: the parameter vectors, the costs and the times since the start.
+
+    The parameter vectors are stored as float32 differences to the previous vector in a ring buffer, i.e. only the
+    last capacity iterations are kept. Each difference is taken to the reconstructed previous vector, so rounding
+    errors do not accumulate along the trajectory.
+    """
+
+    def __init__(self, number_of_params, capacity=1000):
+        self.scipy_result = None
+        self.capacity = capacity
+        self._deltas = np.zeros((capacity, number_of_params), dtype=np.float32)
+        self._costs = np.zeros((capacity,), dtype=float)
+        self._times = np.zeros((capacity,), dtype=float)
+        self._start = 0  # slot of the oldest recorded iteration
+        self._size = 0
+        self._first = None  # reconstructed parameter vector of the oldest recorded iteration
+        self._last = None  # reconstructed parameter vector of the newest recorded iteration
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name == 'scipy_result' or self.scipy_result is None:
+            raise AttributeError(name)
+        return getattr(self.scipy_result, name)
+
+    def __getitem__(self, key):
+        return self.scipy_result[key]
+
+    def __len__(self):
+        return self._size
+
+    def record(self, x, cost, elapsed_time):
+        """ Adds an iteration to the recording. An iteration with the same parameters as the previous one is skipped.
+
+        :param x: parameter vector.
+        :param cost: cost at x.
+        :param elapsed_time: seconds since the start of the optimization.
+        """
+        if self._size == 0:
+            self._first = np.array(x, dtype=float)
+            self._last = np.array(x, dtype=float)
+            slot = self._start
+            self._size = 1
+        else:
+            delta = (np.asarray(x, dtype=float) - self._last).astype(np.float32)
+            if not np.any(delta):
+                return
+
+            if self._size == self.capacity:  # forget the oldest iteration
+                self._start = (self._start + 1) % self.capacity
+                self._first += self._deltas[self._start]
+                self._size -= 1
+
+            slot = (self._start + self._size) % self.capacity
+            self._deltas[slot] = delta
+            self._last += delta
+            self._size += 1
+
+        self._costs[slot] = cost
+        self._times[slot] = elapsed_time
+
+    def _slots(self):
+        return (self._start + np.arange(self._size)) % self.capacity
+
+    def getTrajectory(self):
+        """ Reconstructs the recorded parameter vectors.
+
+        :return: an array with one row per recorded iteration, from the oldest to the newest.
+        """
+        if self._size == 0:
+            return np.zeros((0, self._deltas.shape[1]), dtype=float)
+
+        deltas = self._deltas[self._slots()].astype(float)
+        deltas[0] = self._first
+        return np.cumsum(deltas, axis=0)
+
+    @property
+    def costs(self):
+        return self._costs[self._slots()]
+
+    @property
+    def times(self):
+        return self._times[self._slots()]
+
+
+class Optimizer(object):
 
     def __init__(self):
         """
@@ -74,16 +228,69 @@ class Optimizer:
         """
 
         self.data_models = {}  # a dict with a set of variables or structures to be used by the objective function
+        self.shared_arrays = []  # arrays of the data models stored in shared memory, see shareArray
         self.groups = OrderedDict()  # groups of params an ordered dict where key={name} and value = namedtuple('ParamT')
 
-        self.x = []  # a list of floats (the actual parameters)
-        self.x0 = []  # the initial value of the parameters
-        self.xf = []  # the final value of the parameters
+        # Parameter state is kept in contiguous numpy arrays, one entry per param. Pushed groups are stored in chunks
+        # which are concatenated to the arrays at freeze time (see _freezeParameters), e.g. when x is first read.
+        self._x = np.zeros((0,), dtype=float)  # the actual parameters (use the x property)
+        self.bounds_min = np.zeros((0,), dtype=float)  # min value each param may take
+        self.bounds_max = np.zeros((0,), dtype=float)  # max value each param may take
+        self.scales = np.zeros((0,), dtype=float)  # characteristic scale of each param, a hint for x_scale
+        self.group_ids = np.zeros((0,), dtype=int)  # index of the group (in self.groups) of each param
+        self._param_chunks = []  # list of (values, bound_min, bound_max, scale, group_id) pushed but not yet frozen
+
+        self.fixed_groups = set()  # names of groups kept constant, i.e. removed from the vector given to the solver
+        self.budget_seconds = None  # max wall-clock time of an optimization, None for no limit
+        self.budget_evaluations = None  # max number of calls of the objective function, None for no limit
+        self.subsampling_schedule = [1]  # subsampling factor of the residual blocks in each stage of the optimization
+        self.subsampling_mode = 'stride'
+        self._subsampling_random = np.random.RandomState()
+        self._block_subsets = {}  # dict: key={name template} value = indices of the active residuals in the block
+        self._active_rows = None  # rows of the residuals given to the solver in the current stage, None for all
+        self.solver = 'trf'  # 'trf' for scipy least squares, 'minibatch' for levenberg-marquardt on mini-batches
+        self.minibatch_fraction = 0.1  # fraction of the residuals of each residual block used in a mini-batch
+        self.minibatch_iterations = 100
+        self.minibatch_check_every = 10  # number of mini-batch steps between evaluations of the full cost
+        self.minibatch_damping = 1e-3  # initial levenberg-marquardt damping
+        self._minibatch_random = np.random.RandomState()
+        self._track_best = True  # False while evaluating mini-batches, whose cost is not comparable
+        self.manifold_groups = OrderedDict()  # rotation and pose groups: key={name} value = namedtuple('ManifoldT')
+
+        self.x0 = np.zeros((0,), dtype=float)  # the initial value of the parameters
+        self.xf = np.zeros((0,), dtype=float)  # the final value of the parameters
+        self.errors0 = np.zeros((0,), dtype=float)  # the residuals at x0
+        self.errorsf = np.zeros((0,), dtype=float)  # the residuals at xf
+        self._manifold_state0 = []  # stored rotations of rotation and pose groups which x0 refers to
+        self._manifold_statef = []  # stored rotations of rotation and pose groups which xf refers to
 
         self.residuals = OrderedDict()  # ordered dict: key={residual} value = [params that influence this residual]
+        self.residual_blocks = OrderedDict()  # ordered dict: key={name template} value = namedtuple('ResidualBlockT')
+        self._number_of_residuals = 0  # rows taken by both single residuals and residual blocks
+
+        # Indices maintained incrementally as params and residuals are pushed, so that lookups do not scan the groups
+        self._param_columns = {}  # dict: key={param name} value = column of the param in x
+        self._param_names = []  # list of param names ordered by column
+        self._sorted_param_names = None  # sorted name table for prefix and regex queries, rebuilt lazily
+        self._residual_rows = {}  # dict: key={residual name} value = row of the residual
+
         self.sparse_matrix = None
-        self.result = None  # to contain the optimization result
+        self._last_evaluation = None  # (x given by the solver, residuals) of the last call of the objective function
+        self.result = None  # to contain the optimization result, an OptimizationResult
+        self.recording_capacity = 1000  # max number of iterations recorded in the result
+        self.result_columns = None  # the columns of x given to the solver, i.e. the columns of the result jacobian
+        self.best_x = None  # the x with the lowest cost seen in any evaluation of the current optimization
+        self.best_errors = None
+        self.best_cost = inf
+        self._best_manifold_state = None  # stored rotations of rotation and pose groups when best_x was evaluated
+        self._last_jacobian = None
+        self._number_of_evaluations = 0
+        self._start_time = None
         self.objective_function = None  # to contain the objective function
+        self.objective_blocks = []  # list of namedtuple('ObjectiveBlockT'), each computing part of the residuals
+        self.number_of_threads = 1  # threads used to evaluate the objective blocks
+        self._thread_pool = None
+        self._worker_pool = None  # processes which evaluate the objective function, see startWorkerPool
         # self.visualization_function = None
         self.first_call_of_objective_function = True
 
@@ -110,7 +317,25 @@ class Optimizer:
             self.data_models[name] = data
             # print('Added data ' + name + ' to model dict.')
 
-    def pushParamScalar(self, group_name, data_key, getter, setter, bound_max=+inf, bound_min=-inf):
+    def shareArray(self, array):
+        """ Copies a numpy array to a shared memory segment. Use it for large arrays of the data models (point clouds,
+        images, range maps) so that worker processes attach to them once instead of receiving a copy with each task.
+        Example: data_models['cloud']['points'] = opt.shareArray(points)
+
+        :param array: numpy array.
+        :return: the SharedArray, to be put in the data models in place of the given array.
+        """
+        shared_array = SharedArray(array)
+        self.shared_arrays.append(shared_array)
+        return shared_array
+
+    def releaseSharedArrays(self):
+        """ Frees the shared memory segments created with shareArray. """
+        for shared_array in self.shared_arrays:
+            shared_array.release()
+        self.shared_arrays = []
+
+    def pushParamScalar(self, group_name, data_key, getter, setter, bound_max=+inf, bound_min=-inf, scale=1.0):
         """
         Pushes a new scalar parameter to the parameter vector. The parameter group contains a single element.
         Group name is the same as parameter name.
@@ -120,6 +345,7 @@ class Optimizer:
         :param setter: a function to set the parameter value from the model
         :param bound_max: max value the parameter may take
         :param bound_min: min value the parameter may take
+        :param scale: characteristic scale of the parameter, used as x_scale if the optimization options do not set it
         """
         if group_name in self.groups:  # Cannot add a parameter that already exists
             raise ValueError('Scalar param ' + group_name + ' already exists. Cannot add it.')
@@ -133,14 +359,14 @@ class Optimizer:
                 value) + ' of type ' + str(type(value)))
 
         param_names = [group_name]  # a single parameter with the same name as the group
-        idx = [len(self.x)]
+        idx = [self.getNumberOfParameters()]
+        self._pushParamValues(param_names, idx, value, [bound_max], [bound_min], [scale])  # initial value in x
         self.groups[group_name] = ParamT(param_names, idx, data_key, getter, setter, [bound_max],
                                          [bound_min])  # add to group dict
-        self.x.append(value[0])  # set initial value in x using the value from the data model
         # print('Pushed scalar param ' + group_name + ' to group ' + group_name)
 
     def pushParamV3(self, group_name, data_key, getter, setter, bound_max=(+inf, +inf, +inf),
-                    bound_min=(-inf, -inf, -inf), suffix=['x', 'y', 'z']):
+                    bound_min=(-inf, -inf, -inf), suffix=['x', 'y', 'z'], scale=(1.0, 1.0, 1.0)):
         """
         Pushes a new parameter group of type translation to the parameter vector.
         There will be 3 parameters, *_tx, *_ty, *_tz per translation group
@@ -151,6 +377,7 @@ class Optimizer:
         :param setter: a function to set the parameter value from the model
         :param bound_max: a tuple (max_x, max_y, max_z)
         :param bound_min: a tuple (min_x, min_y, min_z)
+        :param scale: a tuple (scale_x, scale_y, scale_z), used as x_scale if the optimization options do not set it
         """
         if group_name in self.groups:  # Cannot add a parameter that already exists
             raise ValueError('Group ' + group_name + ' already exists. Cannot add it.')
@@ -167,19 +394,18 @@ class Optimizer:
         if not len(suffix) == 3:
             raise ValueError('sufix ' + str(suffix) + ' must be a list of size 3, e.g. ["x", "y", "z"].')
 
-        idxs = range(len(self.x), len(self.x) + 3)  # Compute value of indices
+        idxs = range(self.getNumberOfParameters(), self.getNumberOfParameters() + 3)  # Compute value of indices
 
         param_names = [group_name + suffix[0], group_name + suffix[1], group_name + suffix[2]]
+        self._pushParamValues(param_names, idxs, getter(self.data_models[data_key]), bound_max, bound_min,
+                              scale)  # initial value in x
 
         self.groups[group_name] = ParamT(param_names, idxs, data_key, getter, setter, bound_max,
                                          bound_min)  # add to params dict
-        values = getter(self.data_models[data_key])
-        for value in values:
-            self.x.append(value)  # set initial value in x
         # print('Pushed translation group ' + group_name + ' with params ' + str(param_names))
 
     def pushParamVector(self, group_name, data_key, getter, setter, bound_max=None,
-                        bound_min=None, suffix=None, number_of_params=None):
+                        bound_min=None, suffix=None, number_of_params=None, scale=None):
         """
         Pushes a new parameter group of type translation to the parameter vector.
         There will be 3 parameters, *_tx, *_ty, *_tz per translation group
@@ -191,6 +417,7 @@ class Optimizer:
         :param bound_min: a tuple (min_x, min_y, min_z)
         :param suffix:
         :param number_of_params:
+        :param scale: a tuple of param scales, used as x_scale if the optimization options do not set it
         """
         if group_name in self.groups:  # Cannot add a parameter that already exists
             raise ValueError('Group ' + group_name + ' already exists. Cannot add it.')
@@ -218,15 +445,148 @@ class Optimizer:
         elif not len(suffix) == number_of_params:
             raise ValueError('suffix ' + str(suffix) + ' must be a list, e.g. ["x", "y", "z"].')
 
-        idxs = range(len(self.x), len(self.x) + number_of_params)  # Compute value of indices
+        if scale is None:
+            scale = number_of_params * [1.0]
+
+        idxs = range(self.getNumberOfParameters(), self.getNumberOfParameters() + number_of_params)  # indices
 
         param_names = [group_name + s for s in suffix]
+        self._pushParamValues(param_names, idxs, getter(self.data_models[data_key]), bound_max, bound_min,
+                              scale)  # initial value in x
 
         self.groups[group_name] = ParamT(param_names, idxs, data_key, getter, setter, bound_max,
                                          bound_min)  # add to params dict
-        values = getter(self.data_models[data_key])
-        for value in values:
-            self.x.append(value)  # set initial value in x
+
+    def pushParamRotation(self, group_name, data_key, getter, setter, suffix=['rx', 'ry', 'rz']):
+        """
+        Pushes a new parameter group of type rotation. The getter and setter work with 3x3 rotation matrices, which are
+        stored by the optimizer. The solver only sees 3 parameters, a local update (rotation vector) applied to the
+        stored rotation, which is re-centered after each accepted step. This avoids the singularities of euler angles.
+        :param group_name: the name of the group of parameters, which will have their name derived from the group name.
+        :param data_key: the key of the model into which the parameters map
+        :param getter: a function to retrieve the 3x3 rotation matrix from the model
+        :param setter: a function to set the 3x3 rotation matrix in the model
+        :param suffix: a list of size 3
+        """
+        self._pushParamManifold(group_name, data_key, getter, setter, False, [], [], suffix)
+
+    def pushParamPose(self, group_name, data_key, getter, setter, bound_max=(+inf, +inf, +inf),
+                      bound_min=(-inf, -inf, -inf), suffix=['tx', 'ty', 'tz', 'rx', 'ry', 'rz']):
+        """
+        Pushes a new parameter group of type pose. The getter and setter work with 4x4 homogeneous transformations.
+        There will be 6 parameters, the translation and a local update of the rotation (see pushParamRotation).
+        :param group_name: the name of the group of parameters, which will have their name derived from the group name.
+        :param data_key: the key of the model into which the parameters map
+        :param getter: a function to retrieve the 4x4 transformation from the model
+        :param setter: a function to set the 4x4 transformation in the model
+        :param bound_max: a tuple (max_x, max_y, max_z) for the translation
+        :param bound_min: a tuple (min_x, min_y, min_z) for the translation
+        :param suffix: a list of size 6
+        """
+        if not len(bound_max) == 3 or not len(bound_min) == 3:
+            raise ValueError('bound_max and bound_min must be tuples of size 3, e.g. (max_x, max_y, max_z).')
+
+        self._pushParamManifold(group_name, data_key, getter, setter, True, bound_max, bound_min, suffix)
+
+    def _pushParamManifold(self, group_name, data_key, getter, setter, is_pose, bound_max, bound_min, suffix):
+        if group_name in self.groups:  # Cannot add a parameter that already exists
+            raise ValueError('Group ' + group_name + ' already exists. Cannot add it.')
+
+        if not data_key in self.data_models:  # Check if we have the data_key in the data dictionary
+            raise ValueError('Dataset ' + data_key + ' does not exist. Cannot add group ' + group_name + '.')
+
+        if not len(suffix) == len(bound_max) + 3:
+            raise ValueError('suffix ' + str(suffix) + ' must be a list of size ' + str(len(bound_max) + 3) + '.')
+
+        matrix = np.array(getter(self.data_models[data_key]), dtype=float)
+        manifold = ManifoldT(getter, setter, is_pose, matrix[0:3, 0:3].copy(), np.zeros((3,), dtype=float))
+
+        idxs = range(self.getNumberOfParameters(), self.getNumberOfParameters() + len(suffix))  # Compute indices
+        param_names = [group_name + s for s in suffix]
+
+        # the rotation starts at the stored rotation, i.e. with a zero update
+        values = list(matrix[0:3, 3]) + [0.0, 0.0, 0.0] if is_pose else [0.0, 0.0, 0.0]
+        bound_max = list(bound_max) + [+inf, +inf, +inf]
+        bound_min = list(bound_min) + [-inf, -inf, -inf]
+        self._pushParamValues(param_names, idxs, values, bound_max, bound_min, len(suffix) * [1.0])
+
+        self.manifold_groups[group_name] = manifold
+        self.groups[group_name] = ParamT(param_names, idxs, data_key,
+                                         partial(self._getManifoldParams, group_name=group_name),
+                                         partial(self._setManifoldParams, group_name=group_name),
+                                         bound_max, bound_min)  # add to params dict
+
+    def _getManifoldParams(self, data, group_name):
+        """ Getter of rotation and pose groups: converts the matrix in the data model to params. """
+        return self._manifoldParams({group_name: self.manifold_groups[group_name].getter(data)})[group_name]
+
+    def _manifoldParams(self, matrices):
+        """ Converts the matrices of rotation and pose groups to params, with a single batched conversion of the local
+        updates.
+
+        :param matrices: dict: key={group name} value = 3x3 rotation or 4x4 transformation matrix.
+        :return: dict: key={group name} value = list of params of the group.
+        """
+        matrices = OrderedDict((group_name, np.array(matrices[group_name], dtype=float)) for group_name in matrices)
+        rotation_refs = np.array([self.manifold_groups[group_name].rotation_ref for group_name in matrices])
+        updates = matrixToRodriguesBatch(np.matmul(np.transpose(rotation_refs, (0, 2, 1)),
+                                                   np.array([matrix[0:3, 0:3] for matrix in matrices.values()])))
+
+        params = {}
+        for (group_name, matrix), update in zip(matrices.items(), updates):
+            manifold = self.manifold_groups[group_name]
+            params[group_name] = list(manifold.x_ref + update)
+            if manifold.is_pose:
+                params[group_name] = list(matrix[0:3, 3]) + params[group_name]
+        return params
+
+    def _setManifoldParams(self, data, values, group_name, rotation=None):
+        """ Setter of rotation and pose groups: applies the local update given by the params to the stored rotation
+        and writes the resulting matrix to the data model. The rotation may be given if it was already computed. """
+        manifold = self.manifold_groups[group_name]
+        if rotation is None:
+            update = rodriguesToMatrixBatch(np.array(values[-3:], dtype=float) - manifold.x_ref)[0]
+            rotation = np.dot(manifold.rotation_ref, update)
+        if manifold.is_pose:
+            matrix = np.identity(4)
+            matrix[0:3, 0:3] = rotation
+            matrix[0:3, 3] = values[0:3]
+            manifold.setter(data, matrix)
+        else:
+            manifold.setter(data, rotation)
+
+    def recenterManifolds(self, x=None):
+        """ Folds the current local updates of the rotation and pose groups into the stored rotations, so that the
+        next updates are computed around the rotations given by x. The values in x are not changed.
+
+        :param x: parameter vector. If None the currently stored in the class is used.
+        """
+        if x is None:
+            x = self.x
+
+        x = np.asarray(x, dtype=float)
+        for group_name, rotation in self._getManifoldRotations(x).items():
+            manifold = self.manifold_groups[group_name]
+            rotation_idx = self.groups[group_name].idx[-3:]
+            manifold.rotation_ref[:] = rotation
+            manifold.x_ref[:] = x[rotation_idx[0]:rotation_idx[-1] + 1]
+
+    def _getManifoldRotations(self, x):
+        """ Computes the rotations of all rotation and pose groups given by x, with a single batched conversion of
+        the local updates instead of one call to cv2.Rodrigues per group.
+
+        :param x: parameter vector.
+        :return: OrderedDict: key={group name} value = 3x3 rotation matrix.
+        """
+        if not self.manifold_groups:
+            return OrderedDict()
+
+        x = np.asarray(x, dtype=float)
+        columns = np.array([self.groups[group_name].idx[-3:] for group_name in self.manifold_groups])
+        x_refs = np.array([manifold.x_ref for manifold in self.manifold_groups.values()])
+        rotation_refs = np.array([manifold.rotation_ref for manifold in self.manifold_groups.values()])
+        rotations = np.matmul(rotation_refs, rodriguesToMatrixBatch(x[columns] - x_refs))
+        return OrderedDict(zip(self.manifold_groups.keys(), rotations))
 
     def pushResidual(self, name, params=None):
         """Adds a new residual to the existing list of residuals
@@ -238,13 +598,198 @@ class Optimizer:
         """
 
         # Check if all listed params exist in the self.params
-        existing_params = self.getParameters()
         for param in params:
-            if param not in existing_params:
+            if param not in self._param_columns:
                 raise ValueError('Cannot push residual ' + name + ' because given dependency parameter ' + param +
                                  ' has not been configured. Did you push this parameter?')
 
-        self.residuals[str(name)] = params
+        name = str(name)
+        if name in self.residual_blocks:
+            raise ValueError('Cannot push residual ' + name + ' because a residual block with that name exists.')
+
+        if name not in self._residual_rows:  # an existing residual keeps its row, only its params are replaced
+            self._residual_rows[name] = self._number_of_residuals
+            self._number_of_residuals += 1
+        self.residuals[name] = params
+
+    def pushResidualBlock(self, name_template, number_of_residuals, params, first_index=0):
+        """Adds a block of residuals which share the same list of parameters. Only the template is stored, the names of
+        the residuals (name_template.format(index)) are generated when needed for printing.
+
+        :param name_template: template of the residual names, e.g. 'r_0_1_{}'. Also the key of the block.
+        :type name_template: string
+        :param number_of_residuals: how many residuals the block contains
+        :param params: parameter names which affect all residuals in this block
+        :type params: list
+        :param first_index: index used to generate the name of the first residual of the block
+        """
+        if name_template in self.residual_blocks or name_template in self.residuals:
+            raise ValueError('Residual block ' + name_template + ' already exists. Cannot add it.')
+
+        try:
+            if name_template.format(0) == name_template.format(1):
+                raise ValueError()
+        except (IndexError, KeyError, ValueError):
+            raise ValueError('Residual block name template ' + name_template +
+                             ' must have a single positional field, e.g. "r_0_1_{}".')
+
+        for param in params:
+            if param not in self._param_columns:
+                raise ValueError('Cannot push residual block ' + name_template + ' because given dependency parameter '
+                                 + param + ' has not been configured. Did you push this parameter?')
+
+        self.residual_blocks[name_template] = ResidualBlockT(name_template, first_index, number_of_residuals, params,
+                                                             self._number_of_residuals)
+        self._number_of_residuals += number_of_residuals
+
+    def _pushParamValues(self, param_names, idxs, values, bound_max, bound_min, scale):
+        """ Indexes the names and stores the initial values, bounds and scales of a newly pushed group of parameters.
+        Should be called before adding the group to self.groups. Nothing is stored if the sizes do not match.
+        """
+        values = np.array(values, dtype=float).ravel()
+        if not len(values) == len(param_names):
+            raise ValueError('Getter returned ' + str(len(values)) + ' values, but the group has ' + str(
+                len(param_names)) + ' params.')
+        for name, array in (('bound_max', bound_max), ('bound_min', bound_min), ('scale', scale)):
+            if not len(array) == len(param_names):
+                raise ValueError(name + ' has ' + str(len(array)) + ' values, but the group has ' + str(
+                    len(param_names)) + ' params.')
+
+        self._indexParameters(param_names, idxs)
+
+        self._param_chunks.append((values, np.array(bound_min, dtype=float), np.array(bound_max, dtype=float),
+                                   np.array(scale, dtype=float), len(self.groups)))
+
+    def _freezeParameters(self):
+        """ Concatenates the chunks of pushed parameters to the parameter state arrays. """
+        if not self._param_chunks:
+            return
+
+        values, bounds_min, bounds_max, scales, group_ids = zip(*self._param_chunks)
+        self._param_chunks = []
+        self._x = np.concatenate((self._x,) + values)
+        self.bounds_min = np.concatenate((self.bounds_min,) + bounds_min)
+        self.bounds_max = np.concatenate((self.bounds_max,) + bounds_max)
+        self.scales = np.concatenate((self.scales,) + scales)
+        self.group_ids = np.concatenate(
+            [self.group_ids] + [np.full((len(v),), group_id, dtype=int) for v, group_id in zip(values, group_ids)])
+
+    @property
+    def x(self):
+        """ The parameter vector (numpy array). Reading it freezes any pushed parameters. """
+        self._freezeParameters()
+        return self._x
+
+    @x.setter
+    def x(self, value):
+        self._freezeParameters()
+        self._x = np.asarray(value, dtype=float)
+
+    def _indexParameters(self, param_names, idxs):
+        """ Adds the names of a newly pushed group of parameters to the lookup indices.
+
+        :param param_names: list of names of the parameters in the group
+        :param idxs: columns of the parameters in x
+        """
+        for param_name in param_names:
+            if param_name in self._param_columns:
+                raise ValueError('Param ' + param_name + ' already exists. Use a different group name or suffix.')
+
+        for param_name, idx in zip(param_names, idxs):
+            self._param_columns[param_name] = idx
+            self._param_names.append(param_name)
+        self._sorted_param_names = None  # invalidate the sorted name table
+
+    def setGroupFixed(self, group_name, fixed=True):
+        """ Keeps (or stops keeping) the params of a group constant during the optimization. The values of fixed params
+        stay in x and in the data models, but their columns are removed from the problem given to the solver.
+
+        :param group_name: the name of the group
+        :param fixed: True to fix the group, False to let it be optimized again
+        """
+        if group_name not in self.groups:
+            raise ValueError('Group ' + group_name + ' does not exist. Cannot fix it.')
+
+        if fixed:
+            self.fixed_groups.add(group_name)
+        else:
+            self.fixed_groups.discard(group_name)
+
+    def getFreeColumns(self):
+        """ Gets the columns of x which are optimized, i.e. which do not belong to a fixed group.
+
+        :return: a numpy array with the free columns, in ascending order.
+        """
+        free = np.ones((self.getNumberOfParameters(),), dtype=bool)
+        for group_name in self.fixed_groups:
+            free[self.groups[group_name].idx[0]:self.groups[group_name].idx[-1] + 1] = False
+        return np.flatnonzero(free)
+
+    def setBudget(self, seconds=None, evaluations=None):
+        """ Sets limits for the optimization. When a limit is reached the optimization stops cleanly and the best x
+        seen so far, in any evaluation, is written to the data models and to self.xf.
+
+        :param seconds: max wall-clock time of the optimization. None for no limit.
+        :param evaluations: max number of calls of the objective function, including the ones used to compute the
+        jacobian. None for no limit.
+        """
+        self.budget_seconds = seconds
+        self.budget_evaluations = evaluations
+
+    def setSubsamplingSchedule(self, factors, mode='stride', seed=None):
+        """ Sets a coarse to fine optimization. Each stage uses only one in every factor residuals of each residual
+        block (single residuals are always used) and starts from the result of the previous stage. The last stage always
+        uses all residuals. The objective function may return, for each residual block, either all values or only the
+        ones of the active residuals, which are given by getResidualBlockSubset.
+
+        :param factors: list of subsampling factors, e.g. [16, 4, 1]. A final stage with factor 1 is added if missing.
+        :param mode: 'stride' to use evenly spaced residuals, 'random' to draw a random subset in each stage.
+        :param seed: seed of the random generator used in 'random' mode.
+        """
+        if mode not in ('stride', 'random'):
+            raise ValueError('Unknown subsampling mode ' + str(mode) + '. Use stride or random.')
+
+        factors = [int(factor) for factor in factors]
+        if any(factor < 1 for factor in factors):
+            raise ValueError('Subsampling factors must be integers larger than 0.')
+        if not factors or not factors[-1] == 1:
+            factors.append(1)
+
+        self.subsampling_schedule = factors
+        self.subsampling_mode = mode
+        self._subsampling_random = np.random.RandomState(seed)
+
+    def setSolver(self, solver='trf', batch_fraction=0.1, iterations=100, check_every=10, damping=1e-3, seed=None):
+        """ Selects the solver used by startOptimization.
+
+        'trf' uses the scipy least squares function. 'minibatch' takes levenberg-marquardt steps computed on random
+        mini-batches of the residual blocks (single residuals are in every mini-batch) and checks the cost of all
+        residuals every check_every steps: if it did not decrease the steps are undone and the damping is increased.
+        It stops, with success, when a check decreases the cost by less than ftol (status 2) and, without success, after
+        iterations steps (status 0) or when the damping exceeds 1e12 (status -1).
+        Use it for problems too large for a full evaluation per step. As with setSubsamplingSchedule, the objective
+        function may compute only the residuals given by getResidualBlockSubset.
+
+        :param solver: 'trf' or 'minibatch'.
+        :param batch_fraction: fraction of the residuals of each residual block used in a mini-batch.
+        :param iterations: max number of mini-batch steps.
+        :param check_every: number of mini-batch steps between checks of the full cost.
+        :param damping: initial levenberg-marquardt damping.
+        :param seed: seed of the random generator used to draw the mini-batches.
+        """
+        if solver not in ('trf', 'minibatch'):
+            raise ValueError('Unknown solver ' + str(solver) + '. Use trf or minibatch.')
+        if not 0 < batch_fraction <= 1:
+            raise ValueError('batch_fraction must be in ]0, 1].')
+        if not damping > 0:
+            raise ValueError('damping must be larger than 0.')
+
+        self.solver = solver
+        self.minibatch_fraction = batch_fraction
+        self.minibatch_iterations = int(iterations)
+        self.minibatch_check_every = max(int(check_every), 1)
+        self.minibatch_damping = damping
+        self._minibatch_random = np.random.RandomState(seed)
 
     def setObjectiveFunction(self, handle):
         # type: (function) -> object
@@ -254,6 +799,69 @@ class Optimizer:
         """
         self.objective_function = handle
 
+    def pushObjectiveBlock(self, handle, residuals):
+        """ Adds a function which computes part of the residuals, e.g. the ones of a sensor or of a pair of point
+        clouds. The objective function becomes the evaluation of all the pushed blocks, which run concurrently when
+        setNumberOfThreads is larger than one. The blocks must be independent, i.e. must not change the data models.
+
+        :param handle: function which receives the data models and returns a dictionary with the residuals (and residual
+        blocks) given in residuals, or a sequence with their values concatenated in the same order. When the residuals
+        are subsampled a sequence must contain only the active residuals of each residual block.
+        :param residuals: list of names of residuals or name templates of residual blocks computed by the function.
+        """
+        self.objective_blocks.append(ObjectiveBlockT(handle, list(residuals)))
+        self.objective_function = self._evaluateObjectiveBlocks
+
+    def setNumberOfThreads(self, number_of_threads):
+        """ Sets the number of threads used to evaluate the objective blocks. Threads are useful because most of the
+        work is done in numpy and opencv functions, which release the GIL.
+
+        :param number_of_threads: number of threads. Use 1 to evaluate the blocks sequentially.
+        """
+        self._closeThreadPool()
+        self.number_of_threads = max(int(number_of_threads), 1)
+
+    def _closeThreadPool(self):
+        """ Stops the threads used to evaluate the objective blocks. The pool is created again when needed. """
+        if self._thread_pool is not None:
+            self._thread_pool.close()
+            self._thread_pool.join()
+            self._thread_pool = None
+
+    def _evaluateObjectiveBlocks(self, data_models):
+        if self.number_of_threads > 1 and len(self.objective_blocks) > 1:
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPool(self.number_of_threads)
+            outputs = self._thread_pool.map(lambda block: block.handle(data_models), self.objective_blocks)
+        else:
+            outputs = [block.handle(data_models) for block in self.objective_blocks]
+
+        errors = {}
+        for block, output in zip(self.objective_blocks, outputs):
+            if type(output) is dict:
+                errors.update(output)
+                continue
+
+            values = np.asarray(output, dtype=float).ravel()
+            start = 0
+            for name in block.residuals:
+                if name in self.residual_blocks:
+                    n = len(self.getResidualBlockSubset(name))
+                elif name in self.residuals:
+                    n = 1
+                else:
+                    raise ValueError('Objective block computes residual ' + Fore.RED + name + Fore.RESET +
+                                     ' which does not exist. Use printResiduals to check the configured residuals')
+
+                errors[name] = values[start] if n == 1 and name in self.residuals else values[start:start + n]
+                start += n
+
+            if not start == len(values):
+                raise ValueError('Objective block returned ' + str(len(values)) + ' values but its residuals take ' +
+                                 str(start) + '.')
+
+        return errors
+
     def setInternalVisualization(self, internal_visualization):
         self.internal_visualization = internal_visualization
 
@@ -333,29 +941,457 @@ class Optimizer:
 
         return errors
 
+    def _solverObjectiveFunction(self, x_free, free):
+        """ The function given to the solver, which only sees the free params. Fixed params keep their values in x.
+
+        :param x_free: the values of the free params
+        :param free: the columns of x which x_free maps to
+        """
+        self._checkBudget(1)
+        x = np.array(self.x, dtype=float)
+        x[free] = x_free
+        errors = self.internalObjectiveFunction(x)
+        self._number_of_evaluations += 1
+        self._last_evaluation = (np.array(x_free), errors)
+
+        cost = 0.5 * np.sum(np.square(errors))
+        if self._track_best and cost < self.best_cost:
+            self._setBest(x, errors, cost)
+        return errors
+
+    def _recordIteration(self, x, cost):
+        """ Records an accepted iteration in the result. Rotation and pose params are recorded as rotation vectors of
+        the rotations instead of local updates, so that the recording does not depend on the stored rotations.
+        """
+        self.result.record(self._toRotationVectors(x), cost, time.time() - self._start_time)
+
+    def replayOptimization(self, time_to_wait=0.1, step=1):
+        """ Calls the visualization function for the iterations recorded in the last optimization, so that it can be
+        inspected without visualizing during the optimization. At the end the data models are set to xf.
+
+        :param time_to_wait: seconds to wait between iterations.
+        :param step: replay one in every step iterations.
+        """
+        if self.result is None or len(self.result) == 0:
+            raise ValueError('There is no recorded optimization. Run startOptimization first.')
+        if self.vis_function_handle is None:
+            raise ValueError('There is no visualization function. Use setVisualizationFunction first.')
+
+        manifold_state = self._getManifoldState()
+        for manifold in self.manifold_groups.values():  # the recording has the rotation vectors of the rotations
+            manifold.rotation_ref[:] = np.identity(3)
+            manifold.x_ref[:] = 0.0
+
+        wm = KeyPressManager.WindowManager(self.figures) if self.figures else None
+        trajectory, costs, times = self.result.getTrajectory(), self.result.costs, self.result.times
+        for iteration in range(0, len(trajectory), step):
+            self.fromXToData(trajectory[iteration])
+            print('Iteration ' + str(iteration) + ': cost ' + str(costs[iteration]) + ' at ' + str(times[iteration]) +
+                  ' seconds')
+            self.vis_function_handle(self.data_models)
+            if wm is None:
+                cv2.waitKey(max(int(time_to_wait * 1000), 1))
+            else:
+                wm.waitForKey(time_to_wait=time_to_wait, verbose=False)
+
+        self._setManifoldState(manifold_state)
+        self.fromXToData(self.xf)
+
+    def _checkBudget(self, number_of_evaluations):
+        """ Raises BudgetExhausted if the next evaluations would exceed the budget. """
+        if self.budget_evaluations is not None and \
+                self._number_of_evaluations + number_of_evaluations > self.budget_evaluations:
+            raise BudgetExhausted('Evaluation budget of ' + str(self.budget_evaluations) + ' evaluations exhausted.')
+        if self.budget_seconds is not None and time.time() - self._start_time > self.budget_seconds:
+            raise BudgetExhausted('Time budget of ' + str(self.budget_seconds) + ' seconds exhausted.')
+
+    def _setBest(self, x, errors, cost):
+        self.best_x = np.array(x, dtype=float)
+        self.best_errors = None if errors is None else np.array(errors, dtype=float)
+        self.best_cost = cost
+        self._best_manifold_state = self._getManifoldState()
+
+    def _getManifoldState(self):
+        return [(manifold.rotation_ref.copy(), manifold.x_ref.copy()) for manifold in self.manifold_groups.values()]
+
+    def _setManifoldState(self, manifold_state):
+        for manifold, (rotation_ref, x_ref) in zip(self.manifold_groups.values(), manifold_state):
+            manifold.rotation_ref[:] = rotation_ref
+            manifold.x_ref[:] = x_ref
+
+    def _toRotationVectors(self, x, manifold_state=None):
+        """ Returns a copy of x in which the local updates of rotation and pose groups are replaced by the rotation
+        vectors of the rotations they give.
+
+        :param x: parameter vector.
+        :param manifold_state: the stored rotations x refers to (see _getManifoldState). If None the current ones.
+        """
+        x = np.array(x, dtype=float)
+        if manifold_state is not None:
+            current_state = self._getManifoldState()
+            self._setManifoldState(manifold_state)
+        try:
+            rotations = self._getManifoldRotations(x)
+        finally:
+            if manifold_state is not None:
+                self._setManifoldState(current_state)
+
+        if rotations:
+            columns = np.array([self.groups[group_name].idx[-3:] for group_name in rotations])
+            x[columns] = matrixToRodriguesBatch(np.array(list(rotations.values())))
+        return x
+
+    def _solverJacobian(self, x_free, free, method, rel_step, bounds, sparsity):
+        """ Computes the jacobian for the solver, by finite differences or with the function given as method. The
+        solver computes the jacobian once per accepted step, so this is also where the rotation and pose groups are
+        re-centered.
+        """
+        x = np.array(self.x, dtype=float)
+        x[free] = x_free
+
+        f0 = None  # the solver has just evaluated the residuals at x_free, no need to do it again
+        if self._last_evaluation is not None and np.array_equal(self._last_evaluation[0], x_free):
+            f0 = np.atleast_1d(self._last_evaluation[1])
+        if self._track_best:  # mini-batch steps are recorded only when accepted
+            self._recordIteration(x, np.nan if f0 is None else 0.5 * np.sum(np.square(f0)))
+        self.recenterManifolds(x)
+
+        if callable(method):
+            self._last_jacobian = self._userJacobian(method, x, free)
+        elif self._worker_pool is not None and method == '2-point':
+            self._last_jacobian = self._parallelJacobian(x_free, free, f0, rel_step, bounds, sparsity)
+        else:
+            self._last_jacobian = approx_derivative(self._solverObjectiveFunction, x_free, method=method,
+                                                    rel_step=rel_step, f0=f0, bounds=bounds, sparsity=sparsity,
+                                                    args=(free,))
+        return self._last_jacobian
+
+    def _userJacobian(self, jac, x, free):
+        """ Calls a jacobian function given by the user, jac(x), with the full parameter vector as in the scipy least
+        squares function. Rotation and pose params are given as rotation vectors of the rotations and their columns
+        are converted to derivatives of the local updates seen by the solver. Only the rows of the active residuals and
+        the columns of the free params are kept.
+        """
+        x = np.array(x, dtype=float)
+        rotations = self._getManifoldRotations(x)  # the manifolds were re-centered at x, i.e. the local updates are 0
+        if rotations:
+            columns = np.array([self.groups[group_name].idx[-3:] for group_name in rotations])
+            x[columns] = matrixToRodriguesBatch(np.array(list(rotations.values())))
+
+        J = jac(x)
+        J = csr_matrix(J) if issparse(J) else np.atleast_2d(np.asarray(J, dtype=float))
+        if not J.shape == (self._number_of_residuals, len(x)):
+            raise ValueError('Jacobian function returned a ' + str(J.shape[0]) + 'x' + str(J.shape[1]) + ' matrix, '
+                             'expected ' + str(self._number_of_residuals) + 'x' + str(len(x)) + '.')
+        if self._active_rows is not None:
+            J = J[self._active_rows]
+
+        if rotations:  # R = exp(phi) exp(update), so d phi / d update is the inverse right jacobian at phi
+            blocks = so3_right_jacobian_inverse(x[columns])
+            identity = np.setdiff1d(np.arange(len(x)), columns)
+            rows = np.concatenate((identity, np.repeat(columns, 3, axis=1).ravel()))
+            cols = np.concatenate((identity, np.tile(columns, 3).ravel()))
+            values = np.concatenate((np.ones(len(identity)), blocks.ravel()))
+            chart = csr_matrix((values, (rows, cols)), shape=(len(x), len(x)))
+            J = J * chart if issparse(J) else np.asarray(chart.T.dot(J.T)).T
+
+        return J[:, free]
+
+    def _parallelJacobian(self, x_free, free, f0, rel_step, bounds, sparsity):
+        """ Forward differences jacobian with the perturbed points evaluated in the worker pool. Columns which do not
+        share residuals are perturbed together, as in the scipy approx_derivative function.
+        """
+        if f0 is None:
+            f0 = np.atleast_1d(self._solverObjectiveFunction(x_free, free))
+        if rel_step is None:
+            rel_step = np.finfo(float).eps ** 0.5
+
+        h = rel_step * np.where(x_free >= 0, 1.0, -1.0) * np.maximum(1.0, np.abs(x_free))
+        h = np.where((x_free + h > bounds[1]) | (x_free + h < bounds[0]), -h, h)  # step away from the bounds
+        h = (x_free + h) - x_free  # the step which is actually taken
+
+        if sparsity is None:
+            structure, groups = None, np.arange(len(free))
+        else:
+            structure, groups = sparsity
+
+        xs = []
+        for group in range(np.max(groups) + 1):
+            x = np.array(self.x, dtype=float)
+            x[free] = x_free + h * (groups == group)
+            xs.append(x)
+
+        self._checkBudget(len(xs))
+        errors = self._evaluateInWorkers(xs)
+        self._number_of_evaluations += len(xs)
+        costs = 0.5 * np.sum(np.square(errors), axis=1)
+        best = np.argmin(costs)
+        if self._track_best and costs[best] < self.best_cost:
+            self._setBest(xs[best], errors[best], costs[best])
+
+        differences = errors - f0  # one row per group of columns
+        if structure is None:
+            return (differences / h[:, None]).T
+
+        structure = coo_matrix(structure)
+        values = differences[groups[structure.col], structure.row] / h[structure.col]
+        return csr_matrix((values, (structure.row, structure.col)), shape=structure.shape)
+
+    def startWorkerPool(self, number_of_workers=None):
+        """ Starts processes which receive a copy of the problem (data models, params, residuals and objective function)
+        once. Afterwards only parameter vectors are sent to them, e.g. to compute the perturbed points of the jacobian
+        ('2-point' method) in parallel, or to evaluate several starting points with evaluateInParallel. The pool is
+        kept for the following optimizations.
+        The workers hold a snapshot of the data models taken when the pool is started (with the fork start method, the
+        default on linux, the memory of this process at that moment). Later changes to the data models are not seen by
+        the workers, except in-place changes to arrays shared with shareArray, so start the pool again after changing
+        them.
+
+        :param number_of_workers: number of processes. If None the number of cpus is used.
+        """
+        self.stopWorkerPool()
+        self._closeThreadPool()  # forked workers would inherit the pool, but not its threads, and wait on it forever
+        self._worker_pool = WorkerPool(self, number_of_workers)
+
+    def stopWorkerPool(self):
+        if self._worker_pool is not None:
+            self._worker_pool.close()
+            self._worker_pool = None
+
+    def evaluateInParallel(self, xs):
+        """ Evaluates the objective function in the worker pool.
+
+        :param xs: list of parameter vectors.
+        :return: an array with one row of residuals per parameter vector.
+        """
+        if self._worker_pool is None:
+            raise ValueError('There is no worker pool. Use startWorkerPool first.')
+        return self._evaluateInWorkers(xs)
+
+    def _evaluateInWorkers(self, xs):
+        state = (self._getManifoldState(), self._block_subsets, self._active_rows)
+        return np.array(self._worker_pool.map(_evaluateInWorker, [(x, state) for x in xs]), dtype=float)
+
+    def __getstate__(self):
+        """ The state used by pickle. Visualization is not copied, and the functions given by the user are checked to
+        be importable, since pickle sends functions by their module and name.
+        """
+        state = self.__dict__.copy()
+        state['_thread_pool'] = None  # pools are not copied, they are created again when needed
+        state['_worker_pool'] = None
+        for attribute in VISUALIZATION_ATTRIBUTES:
+            state.pop(attribute, None)
+        state['vis_function_handle'] = None
+        state['always_visualize'] = False
+
+        # The getters and setters of rotation and pose groups are methods of this object, created again when unpickled
+        state['groups'] = OrderedDict()
+        for group_name, group in self.groups.items():
+            if group_name in self.manifold_groups:
+                group = group._replace(getter=None, setter=None)
+            else:
+                checkImportable(group.getter, 'Getter of group ' + group_name)
+                checkImportable(group.setter, 'Setter of group ' + group_name)
+            state['groups'][group_name] = group
+
+        for manifold_name, manifold in self.manifold_groups.items():
+            checkImportable(manifold.getter, 'Getter of group ' + manifold_name)
+            checkImportable(manifold.setter, 'Setter of group ' + manifold_name)
+
+        if self.objective_blocks and self.objective_function == self._evaluateObjectiveBlocks:
+            state['objective_function'] = None
+            for block in self.objective_blocks:
+                checkImportable(block.handle, 'Objective block')
+        elif self.objective_function is not None:
+            checkImportable(self.objective_function, 'Objective function')
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.figures = []
+        for group_name in self.manifold_groups:
+            self.groups[group_name] = self.groups[group_name]._replace(
+                getter=partial(self._getManifoldParams, group_name=group_name),
+                setter=partial(self._setManifoldParams, group_name=group_name))
+
+        if self.objective_function is None and self.objective_blocks:
+            self.objective_function = self._evaluateObjectiveBlocks
+
+    def saveProblem(self, filename):
+        """ Saves the configured problem (data models, params, residuals, objective function and the result, if any)
+        to a file. Functions are saved by module and name, so they must be importable when the problem is loaded.
+        Arrays created with shareArray are saved by the name of their shared memory segment, i.e. they can only be
+        loaded while the segments exist.
+
+        :param filename: name of the file.
+        """
+        with open(filename, 'wb') as file_handle:
+            pickle.dump(self.__getstate__(), file_handle, pickle.HIGHEST_PROTOCOL)
+
+    def loadProblem(self, filename):
+        """ Replaces the configuration of this optimizer by the one saved in a file with saveProblem.
+
+        :param filename: name of the file.
+        """
+        self.stopWorkerPool()
+        with open(filename, 'rb') as file_handle:
+            state = pickle.load(file_handle)
+        self.__dict__.clear()
+        self.__setstate__(state)
+
+    def exportProblem(self, filename):
+        """ Saves the layout of the problem and its numeric results to a binary file: names, groups, bounds and
+        scales of the params, names and rows of the residuals and residual blocks, the sparse matrix (CSR), x0, xf and
+        the residuals at x0 and xf. The params of rotation and pose groups in x0 and xf are saved as rotation vectors
+        of the rotations instead of local updates. Data models and functions are not saved (see saveProblem). The file
+        is written with numpy (.npz) or, if the name ends with .h5 or .hdf5, with h5py.
+
+        :param filename: name of the file.
+        """
+        groups = list(self.groups.values())
+        sparse_matrix = self.sparse_matrix
+        if sparse_matrix is None:
+            sparse_matrix = csr_matrix((self._number_of_residuals, self.getNumberOfParameters()), dtype=float)
+        residual_names = list(self.residuals.keys())
+        blocks = list(self.residual_blocks.values())
+        x0, xf = self.x0, self.xf
+        if len(x0) == self.getNumberOfParameters():
+            x0 = self._toRotationVectors(x0, self._manifold_state0)
+        if len(xf) == self.getNumberOfParameters():
+            xf = self._toRotationVectors(xf, self._manifold_statef)
+
+        arrays = {'param_names': _encodeStrings(self._param_names),
+                  'group_names': _encodeStrings(self.groups.keys()),
+                  'group_data_keys': _encodeStrings([group.data_key for group in groups]),
+                  'group_first_columns': np.array([group.idx[0] for group in groups], dtype=int),
+                  'group_sizes': np.array([len(group.idx) for group in groups], dtype=int),
+                  'group_is_fixed': np.array([name in self.fixed_groups for name in self.groups], dtype=bool),
+                  'group_is_manifold': np.array([name in self.manifold_groups for name in self.groups], dtype=bool),
+                  'bounds_min': self.bounds_min, 'bounds_max': self.bounds_max, 'scales': self.scales,
+                  'residual_names': _encodeStrings(residual_names),
+                  'residual_rows': np.array([self._residual_rows[name] for name in residual_names], dtype=int),
+                  'block_name_templates': _encodeStrings([block.name_template for block in blocks]),
+                  'block_first_indices': np.array([block.first_index for block in blocks], dtype=int),
+                  'block_sizes': np.array([block.number_of_residuals for block in blocks], dtype=int),
+                  'block_rows': np.array([block.row for block in blocks], dtype=int),
+                  'sparse_matrix_indptr': sparse_matrix.indptr, 'sparse_matrix_indices': sparse_matrix.indices,
+                  'sparse_matrix_shape': np.array(sparse_matrix.shape, dtype=int),
+                  'x0': x0, 'xf': xf, 'errors0': self.errors0, 'errorsf': self.errorsf}
+
+        if filename.endswith('.h5') or filename.endswith('.hdf5'):
+            if h5py is None:
+                raise ImportError('h5py is needed to export problems to HDF5 files. Use a .npz file instead.')
+            with h5py.File(filename, 'w') as file_handle:
+                for key, value in arrays.items():
+                    file_handle.create_dataset(key, data=value)
+        else:
+            with open(filename, 'wb') as file_handle:
+                np.savez(file_handle, **arrays)
+
+    def importProblem(self, filename):
+        """ Loads a problem written by exportProblem, e.g. to analyse or compare results without the original data. The
+        params, residuals, sparse matrix, x0, xf and residuals are restored; there are no data models, so getters and
+        setters are None and the problem cannot be optimized again. The stored rotations of rotation and pose groups are
+        the identity, since x0 and xf have the rotation vectors of the rotations.
+
+        :param filename: name of the file.
+        """
+        if filename.endswith('.h5') or filename.endswith('.hdf5'):
+            if h5py is None:
+                raise ImportError('h5py is needed to import problems from HDF5 files.')
+            with h5py.File(filename, 'r') as file_handle:
+                arrays = dict((key, file_handle[key][()]) for key in file_handle)
+        else:
+            with np.load(filename) as file_handle:
+                arrays = dict((key, file_handle[key]) for key in file_handle.files)
+
+        self.__init__()
+
+        param_names = _decodeStrings(arrays['param_names'])
+        self._indexParameters(param_names, range(len(param_names)))
+        self.bounds_min, self.bounds_max, self.scales = arrays['bounds_min'], arrays['bounds_max'], arrays['scales']
+        data_keys = _decodeStrings(arrays['group_data_keys'])
+        for group_id, group_name in enumerate(_decodeStrings(arrays['group_names'])):
+            first, size = arrays['group_first_columns'][group_id], arrays['group_sizes'][group_id]
+            self.groups[group_name] = ParamT(param_names[first:first + size], list(range(first, first + size)),
+                                             data_keys[group_id], None, None, list(self.bounds_max[first:first + size]),
+                                             list(self.bounds_min[first:first + size]))
+            if arrays['group_is_fixed'][group_id]:
+                self.fixed_groups.add(group_name)
+            if arrays['group_is_manifold'][group_id]:
+                self.manifold_groups[group_name] = ManifoldT(None, None, size == 6, np.identity(3), np.zeros((3,)))
+        self.group_ids = np.repeat(np.arange(len(self.groups)), arrays['group_sizes'])
+        self._x = np.array(arrays['x0'], dtype=float) if len(arrays['x0']) else np.zeros(len(param_names))
+
+        shape = tuple(arrays['sparse_matrix_shape'])
+        sparse_matrix = csr_matrix((np.ones(len(arrays['sparse_matrix_indices'])), arrays['sparse_matrix_indices'],
+                                    arrays['sparse_matrix_indptr']), shape=shape)
+        rows = sorted([(row, name, None) for name, row in zip(_decodeStrings(arrays['residual_names']),
+                                                              arrays['residual_rows'])] +
+                      [(row, template, (first_index, size)) for template, first_index, size, row in
+                       zip(_decodeStrings(arrays['block_name_templates']), arrays['block_first_indices'],
+                           arrays['block_sizes'], arrays['block_rows'])])
+        for row, name, block in rows:  # push in row order, so that each one gets its original row
+            params = [param_names[column] for column in sparse_matrix[row].indices]
+            if block is None:
+                self.pushResidual(name, params)
+            else:
+                self.pushResidualBlock(name, int(block[1]), params, first_index=int(block[0]))
+
+        self.sparse_matrix = sparse_matrix
+        self.x0, self.xf = arrays['x0'], arrays['xf']
+        self._manifold_state0 = self._manifold_statef = self._getManifoldState()
+        self.errors0, self.errorsf = arrays['errors0'], arrays['errorsf']
+
     def errorDictToList(self, errors):
+        """ Converts the output of the objective function to a list ordered by residual row. A dictionary output must
+        contain a value for each residual and a sequence of values for each residual block (key is the name template).
+        When the residuals are subsampled only the active ones are returned.
+        """
 
-        if type(errors) is list:
+        if type(errors) is list or type(errors) is np.ndarray:
             error_list = errors
+            if self._active_rows is not None and len(errors) == self._number_of_residuals:
+                error_list = np.asarray(errors, dtype=float)[self._active_rows]
         elif type(errors) is dict:
             error_dict = errors
-            error_list = []
+            error_list = np.empty((self._number_of_residuals,), dtype=float)
 
             for error_dict_key in error_dict.keys():  # Check if some of the retuned residuals are not configured.
-                # if error_dict_key not in self.residuals.keys():
-                if not self.residuals.has_key(error_dict_key):
-                        raise ValueError('Objective function returned dictionary with residual ' + Fore.RED +
+                if error_dict_key not in self.residuals and error_dict_key not in self.residual_blocks:
+                    raise ValueError('Objective function returned dictionary with residual ' + Fore.RED +
                                      error_dict_key + Fore.RESET +
                                      ' which does not exist. Use printResiduals to check the configured residuals')
 
-            for residual in self.residuals:  # residuals is an ordered dict to recover a correctly ordered list
-                # if residual not in error_dict.keys():
-                if not error_dict.has_key(residual):
+            for residual in self.residuals:
+                if residual not in error_dict:
                     raise ValueError(
                         'Objective function returned dictionary which does not contain the residual ' + Fore.RED +
                         residual + Fore.RESET + '. This residual is mandatory.')
 
-                error_list.append(error_dict[residual])
+                error_list[self._residual_rows[residual]] = error_dict[residual]
+
+            for name_template, block in self.residual_blocks.items():
+                if name_template not in error_dict:
+                    raise ValueError(
+                        'Objective function returned dictionary which does not contain the residual block ' +
+                        Fore.RED + name_template + Fore.RESET + '. This residual block is mandatory.')
+
+                values = np.asarray(error_dict[name_template], dtype=float).ravel()
+                subset = self._block_subsets.get(name_template)
+                if subset is not None and len(values) == len(subset):  # only the active residuals were computed
+                    error_list[block.row + subset] = values
+                    continue
+
+                if not len(values) == block.number_of_residuals:
+                    raise ValueError('Objective function returned ' + str(len(values)) + ' values for residual block ' +
+                                     name_template + ', which has ' + str(block.number_of_residuals) + ' residuals.')
+
+                error_list[block.row:block.row + block.number_of_residuals] = values
+
+            if self._active_rows is not None:
+                error_list = error_list[self._active_rows]
 
         else:
             raise ValueError('errors of unknown type ' + str(type(errors)))
@@ -368,25 +1404,24 @@ class Optimizer:
 
         :param optimization_options: dict with options for the least squares scipy function.
         Check https://docs.scipy.org/doc/scipy/reference/generated/scipy.optimize.least_squares.html
+        'jac' may be a function jac(x) which returns the jacobian (dense or sparse) of all residuals w.r.t. all params.
+        It receives the params of rotation and pose groups as rotation vectors, see _userJacobian.
+        At the end self.xf has all params, while self.result.x has only the ones given to the solver (see
+        self.result_columns). Without a budget self.xf has the x of the solver result, otherwise the best x evaluated
+        (see setBudget).
         """
-        self.x0 = deepcopy(self.x)  # store current x as initial parameter values
+        self.x0 = np.array(self.x, dtype=float)  # store a copy of current x as initial parameter values
+        self._manifold_state0 = self._getManifoldState()
         self.fromXToData()  # copy from x to data models
+        self._setSubsampling(1)
         # Call objective func. to get initial residuals.
         errors = self.errorDictToList(self.objective_function(self.data_models))
-        self.errors0 = deepcopy(errors)  # store initial residuals for future reference
+        self.errors0 = np.array(errors, dtype=float)  # store initial residuals for future reference
 
-        if not len(self.residuals.keys()) == len(self.errors0):  # check if residuals are properly configured
+        if not self._number_of_residuals == len(self.errors0):  # check if residuals are properly configured
             raise ValueError(
                 'Number of residuals returned by the objective function (' + str(len(self.errors0)) +
-                ') is not consistent with the number of residuals configured (' + str(len(self.residuals.keys())) + ')')
-
-        # Setup boundaries for parameters
-        bounds_min = []
-        bounds_max = []
-        for name in self.groups:
-            _, _, _, _, _, bound_max, bound_min = self.groups[name]
-            bounds_max.extend(bound_max)
-            bounds_min.extend(bound_min)
+                ') is not consistent with the number of residuals configured (' + str(self._number_of_residuals) + ')')
 
         if self.always_visualize:
 
@@ -410,14 +1445,226 @@ class Optimizer:
 
         # Call optimization function (finally!)
         print("Starting optimization ...")
-        self.result = least_squares(self.internalObjectiveFunction, self.x, verbose=2, jac_sparsity=self.sparse_matrix,
-                                    bounds=(bounds_min, bounds_max), method='trf', args=(), **optimization_options)
-
-        self.xf = deepcopy(list(self.result.x))  # Store final x values
-        self.fromXToData(self.xf)
+        self._number_of_evaluations = 0
+        self._start_time = time.time()
+        self.result = OptimizationResult(len(self.x0), self.recording_capacity)
+        self._recordIteration(self.x0, 0.5 * np.sum(np.square(self.errors0)))
+        try:
+            for stage, factor in enumerate(self.subsampling_schedule):
+                self._setSubsampling(factor)
+                if factor > 1:
+                    print('Stage ' + str(stage) + ': using ' + str(len(self._active_rows)) + ' of ' +
+                          str(self._number_of_residuals) + ' residuals.')
+
+                self._setBest(self.x, None, inf)  # costs of different stages are not comparable
+                self.result.scipy_result = self._solveLeastSquares(optimization_options)
+                self._writeResultX()  # warm start of the next stage
+                if self.result.status == BUDGET_EXHAUSTED:
+                    break
 
+            self._setSubsampling(1)
+            if self.result.fun is not None and len(self.result.fun) == self._number_of_residuals:
+                self.errorsf = np.array(self.result.fun, dtype=float)
+            else:  # the best x was found on a subset of the residuals
+                self.errorsf = np.array(self.errorDictToList(self.objective_function(self.data_models)),
+                                        dtype=float)
+        finally:
+            self._closeThreadPool()  # the threads are not kept alive between optimizations
         self.finalOptimizationReport()  # print an informative report
 
+    def _setSubsampling(self, factor):
+        """ Selects the active residuals of each residual block for a subsampling factor."""
+        self._block_subsets = {}
+        self._active_rows = None
+        if factor == 1:
+            return
+
+        rows = [np.array([self._residual_rows[name] for name in self.residuals], dtype=int)]
+        for name_template, block in self.residual_blocks.items():
+            n = int(np.ceil(block.number_of_residuals / float(factor)))
+            if self.subsampling_mode == 'stride':
+                subset = np.arange(0, block.number_of_residuals, factor)
+            else:
+                subset = np.sort(self._subsampling_random.choice(block.number_of_residuals, n, replace=False))
+
+            self._block_subsets[name_template] = subset
+            rows.append(block.row + subset)
+
+        self._active_rows = np.sort(np.concatenate(rows))
+
+    def getResidualBlockSubset(self, name_template):
+        """ Gets the indices (0 for the first residual of the block) of the residuals of a block used in the current
+        stage of the optimization. An objective function may compute and return only these values for the block.
+
+        :param name_template: name template of the residual block
+        """
+        subset = self._block_subsets.get(name_template)
+        if subset is None:
+            return np.arange(self.residual_blocks[name_template].number_of_residuals)
+        return subset
+
+    def _solveLeastSquares(self, optimization_options):
+        """ Calls the scipy least squares solver on the free params. If the budget is exhausted the solver is stopped
+        and a result is built from the best x seen so far.
+
+        :param optimization_options: dict with options for the least squares scipy function.
+        :return: the scipy OptimizeResult, with x, jac, etc. only for the free params (see self.result_columns).
+        """
+        # Remove the fixed params from the problem given to the solver
+        free = self.getFreeColumns()
+        jac_sparsity = None
+        if self.sparse_matrix is not None:
+            jac_sparsity = self.sparse_matrix
+            if self._active_rows is not None:  # params which do not influence any of the active residuals are left out
+                jac_sparsity = jac_sparsity[self._active_rows]
+                free = free[np.diff(jac_sparsity.tocsc().indptr)[free] > 0]
+            jac_sparsity = jac_sparsity.tocsc()[:, free]
+            jac_sparsity = (jac_sparsity, group_columns(jac_sparsity))  # columns perturbed together, computed once
+
+        if len(free) == 0:
+            raise ValueError('All groups are fixed. There are no params to optimize.')
+
+        bounds = (self.bounds_min[free], self.bounds_max[free])
+
+        optimization_options = dict(optimization_options)
+        jac_method = optimization_options.pop('jac', '2-point')
+        if not callable(jac_method) and jac_method not in ('2-point', '3-point', 'cs'):
+            raise ValueError('Unknown jac ' + str(jac_method) + '. Use 2-point, 3-point, cs or a function.')
+        rel_step = optimization_options.pop('diff_step', None)
+        jacobian = partial(self._solverJacobian, method=jac_method, rel_step=rel_step, bounds=bounds,
+                           sparsity=jac_sparsity)
+        if 'x_scale' not in optimization_options:  # use the scales given when pushing the params
+            optimization_options['x_scale'] = self.scales
+        if not isinstance(optimization_options['x_scale'], str):
+            optimization_options['x_scale'] = np.asarray(optimization_options['x_scale'])[free]
+
+        self._last_evaluation = None
+        self._last_jacobian = None
+        self.result_columns = free
+        try:
+            if self.solver == 'minibatch':
+                return self._solveMiniBatch(free, bounds, jac_method, rel_step, optimization_options.get('ftol', 1e-8))
+            return least_squares(self._solverObjectiveFunction, self.x[free], verbose=2, jac=jacobian, bounds=bounds,
+                                 method='trf', args=(free,), **optimization_options)
+        except BudgetExhausted as exception:
+            print(str(exception) + ' Stopping with the best x found so far.')
+            if self.best_errors is None:  # exhausted before the first evaluation, the result is the starting point
+                errors = np.array(self.internalObjectiveFunction(self.best_x), dtype=float)
+                self._number_of_evaluations += 1
+                self._setBest(self.best_x, errors, 0.5 * np.sum(np.square(errors)))
+            return OptimizeResult(x=self.best_x[free], cost=self.best_cost, fun=self.best_errors,
+                                  jac=self._last_jacobian, nfev=self._number_of_evaluations, njev=None,
+                                  status=BUDGET_EXHAUSTED, success=False, message=str(exception))
+
+    def _solveMiniBatch(self, free, bounds, jac_method, rel_step, ftol):
+        """ Levenberg-marquardt on random mini-batches of the residuals, see setSolver. Steps are accepted in groups
+        by comparing the cost of all residuals with the one of the best x, which is where a rejected group of steps
+        returns to.
+        """
+        stage_subsets, stage_rows = self._block_subsets, self._active_rows
+        sparse_matrix = self.sparse_matrix
+        damping = self.minibatch_damping
+
+        x_free = np.array(self.x[free], dtype=float)
+        self._solverObjectiveFunction(x_free, free)  # cost of all residuals at the starting point
+        status, message = 0, 'Maximum number of mini-batch iterations reached.'  # as max_nfev in least squares
+        for iteration in range(1, self.minibatch_iterations + 1):
+            self._setMiniBatch(stage_subsets)
+            self._track_best = False
+            try:
+                errors = np.atleast_1d(self._solverObjectiveFunction(x_free, free))
+                sparsity = None
+                if sparse_matrix is not None:
+                    sparsity = sparse_matrix[self._active_rows].tocsc()[:, free]
+                    sparsity = (sparsity, group_columns(sparsity))
+                J = self._solverJacobian(x_free, free, jac_method, rel_step, bounds, sparsity)
+            finally:
+                self._block_subsets, self._active_rows = stage_subsets, stage_rows
+                self._track_best = True
+
+            # Damped normal equations (J^T J + damping * diag(J^T J)) step = -J^T r. Params without residuals in the
+            # mini-batch have a zero gradient, so a unit diagonal keeps their step at zero.
+            gradient = J.T.dot(errors)
+            if issparse(J):
+                normal = (J.T * J).tocsc()
+                diagonal = normal.diagonal()
+                diagonal[diagonal == 0] = 1.0
+                step = splu((normal + diags(damping * diagonal)).tocsc()).solve(-gradient)
+            else:
+                normal = J.T.dot(J)
+                diagonal = np.diag(normal).copy()
+                diagonal[diagonal == 0] = 1.0
+                step = np.linalg.solve(normal + np.diag(damping * diagonal), -gradient)
+
+            x_free = np.clip(x_free + step, bounds[0], bounds[1])
+
+            if iteration % self.minibatch_check_every == 0 or iteration == self.minibatch_iterations:
+                previous_cost = self.best_cost
+                errors = self._solverObjectiveFunction(x_free, free)  # updates the best x if the full cost decreased
+                cost = 0.5 * np.sum(np.square(errors))
+                print('Mini-batch iteration ' + str(iteration) + ': cost ' + str(cost) + ', damping ' + str(damping))
+                if cost < previous_cost:
+                    damping /= 3.0
+                    self._recordIteration(self.best_x, cost)
+                else:  # go back to the best x
+                    damping *= 10.0
+                    self._setManifoldState(self._best_manifold_state)
+                    x_free = self.best_x[free].copy()
+
+                if 0 <= previous_cost - cost <= ftol * previous_cost:  # an increase of the cost is not convergence
+                    status, message = 2, '`ftol` termination condition is satisfied.'
+                    break
+                if damping > 1e12:
+                    status, message = -1, 'The mini-batch steps do not decrease the cost (damping above 1e12).'
+                    break
+
+        return OptimizeResult(x=self.best_x[free], cost=self.best_cost, fun=self.best_errors, jac=None,
+                              nfev=self._number_of_evaluations, njev=iteration, status=status, success=status > 0,
+                              message=message)
+
+    def _setMiniBatch(self, stage_subsets):
+        """ Draws a random mini-batch from the residuals of each residual block active in the current stage. """
+        self._block_subsets = {}
+        rows = [np.array([self._residual_rows[name] for name in self.residuals], dtype=int)]
+        for name_template, block in self.residual_blocks.items():
+            subset = stage_subsets.get(name_template)
+            if subset is None:
+                subset = np.arange(block.number_of_residuals)
+            n = max(int(round(len(subset) * self.minibatch_fraction)), 1)
+            subset = np.sort(self._minibatch_random.choice(subset, n, replace=False))
+
+            self._block_subsets[name_template] = subset
+            rows.append(block.row + subset)
+
+        self._active_rows = np.sort(np.concatenate(rows))
+
+    def _writeResultX(self):
+        """ Writes the x of the last solver result to self.xf, self.x and the data models. With a budget the solver may
+        have been stopped, so the best x evaluated is written instead. The mini-batch solver returns its best x.
+        """
+        if self.solver == 'minibatch' or self.budget_seconds is not None or self.budget_evaluations is not None:
+            self.writeBestX()
+            return
+
+        # the solver computes the jacobian at each accepted x, so the stored rotations are the ones x refers to
+        x = np.array(self.x, dtype=float)
+        x[self.result_columns] = self.result.x
+        self._writeX(x)
+
+    def writeBestX(self):
+        """ Writes the best x seen in the last optimization to self.xf, self.x and the data models. The best x may be
+        any evaluated point, e.g. one of the perturbed points used to compute the jacobian.
+        """
+        self._setManifoldState(self._best_manifold_state)
+        self._writeX(self.best_x)
+
+    def _writeX(self, x):
+        self.xf = np.array(x, dtype=float)  # Store the final x values
+        self.x = np.array(x, dtype=float)
+        self.fromXToData(self.xf)
+        self.recenterManifolds(self.xf)
+        self._manifold_statef = self._getManifoldState()
+
     def finalOptimizationReport(self):
         """Just print some info and show the images"""
         print('\n-------------\nOptimization finished: ' + self.result['message'])
@@ -429,6 +1676,47 @@ class Optimizer:
                 if self.wm.waitForKey(time_to_wait=0.1, verbose=False) == 'x':
                     break
 
+    def computeCovariance(self, groups=None, residual_variance=None):
+        """ Computes the marginal covariance of groups of params from the jacobian at the end of the optimization. The
+        normal matrix J^T J is factorized once (sparse LU) and only the columns of its inverse which belong to the
+        groups are solved for, so the dense inverse is never formed. For rotation and pose groups the covariance is the
+        one of the local update of the rotation.
+
+        :param groups: list of group names. If None all groups which are not fixed are used.
+        :param residual_variance: variance of the residuals. If None it is estimated from the final cost.
+        :return: an ordered dict with key={group name} and value = covariance matrix (numpy array) of the group.
+        """
+        if self.result is None or self.result.jac is None:
+            raise ValueError('There is no jacobian. Run startOptimization with the trf solver before computing the '
+                             'covariance.')
+
+        if groups is None:
+            groups = [group_name for group_name in self.groups if group_name not in self.fixed_groups]
+
+        J = csc_matrix(self.result.jac)
+        m, n = J.shape
+        if residual_variance is None:
+            residual_variance = 2 * self.result.cost / (m - n) if m > n else 1.0
+
+        try:
+            lu = splu((J.T * J).tocsc(), permc_spec='MMD_AT_PLUS_A')
+        except RuntimeError:
+            raise ValueError('J^T J is singular, some params are not observable. Fix a group (e.g. a reference pose) '
+                             'with setGroupFixed and optimize again.')
+
+        covariances = OrderedDict()
+        for group_name in groups:
+            columns = np.searchsorted(self.result_columns, self.groups[group_name].idx)
+            if group_name in self.fixed_groups or np.any(columns >= n) or \
+                    not np.array_equal(self.result_columns[columns], self.groups[group_name].idx):
+                raise ValueError('Group ' + group_name + ' was not optimized. Cannot compute its covariance.')
+
+            E = np.zeros((n, len(columns)), dtype=float)  # columns of the identity for this group
+            E[columns, range(len(columns))] = 1.0
+            covariances[group_name] = residual_variance * lu.solve(E)[columns, :]
+
+        return covariances
+
     # ---------------------------
     # Utilities
     # ---------------------------
@@ -442,25 +1730,104 @@ class Optimizer:
         if x is None:
             x = self.x
 
-        return x * np.array([random.uniform(1 - noise, 1 + noise) for _ in xrange(len(x))], dtype=np.float)
+        return x * np.random.uniform(1 - noise, 1 + noise, len(x))
 
     def getParameters(self):
         """ Gets all the existing parameters
 
         :return: a list with all the parameter names.
         """
-        params = []
-        for group_name, group in self.groups.items():
-            params.extend(group.param_names)
-        return params
+        return list(self._param_names)
 
     def getParamsContainingPattern(self, pattern):
+        """ Gets the parameters whose names contain pattern. All names are scanned, so use getParamsWithPrefix when
+        the pattern is the start of the names, e.g. inside loops over groups.
+
+        :param pattern: string contained in the parameter names
+        :return: a list with the parameter names, ordered by column.
+        """
+        return [param_name for param_name in self._param_names if pattern in param_name]
+
+    def getParamsWithPrefix(self, prefix):
+        """ Gets the parameters whose names start with prefix, using a binary search on the sorted name table.
+
+        :param prefix: string with the start of the parameter names
+        :return: a list with the parameter names, ordered by column.
+        """
+        names = self._getSortedParamNames()
         params = []
-        for group_name, group in self.groups.items():
-            for i, param_name in enumerate(group.param_names):
-                if pattern in param_name:
-                    params.append(param_name)
-        return params
+        i = bisect_left(names, prefix)
+        while i < len(names) and names[i].startswith(prefix):
+            params.append(names[i])
+            i += 1
+        return sorted(params, key=self._param_columns.get)
+
+    def getParamsMatchingRegex(self, regex):
+        """ Gets the parameters whose names match a regular expression (re.match semantics). The literal prefix of the
+        expression, if any, is used to narrow the search on the sorted name table.
+
+        :param regex: string or compiled regular expression
+        :return: a list with the parameter names, ordered by column.
+        """
+        compiled = re.compile(regex)
+
+        # Only a run of plain characters not followed by a quantifier is a prefix every match must start with
+        literal_prefix = ''
+        if '|' not in compiled.pattern and not compiled.flags & re.IGNORECASE:
+            literal_prefix = re.match(r'[\w\- ]*', compiled.pattern).group(0)
+            if compiled.pattern[len(literal_prefix):len(literal_prefix) + 1] in ('*', '+', '?', '{'):
+                literal_prefix = literal_prefix[:-1]
+
+        return [param_name for param_name in self.getParamsWithPrefix(literal_prefix) if compiled.match(param_name)]
+
+    def getParamColumn(self, param_name):
+        """ Gets the column (index in x) of a parameter.
+
+        :param param_name: name of the parameter
+        """
+        return self._param_columns[param_name]
+
+    def getGroupColumns(self, group_name):
+        """ Gets the columns (indices in x) of the parameters in a group.
+
+        :param group_name: name of the group
+        """
+        return self.groups[group_name].idx
+
+    def getResidualRow(self, residual_name):
+        """ Gets the row (index in the residuals vector) of a residual.
+
+        :param residual_name: name of the residual
+        """
+        return self._residual_rows[residual_name]
+
+    def getNumberOfResiduals(self):
+        return self._number_of_residuals
+
+    def getResidualNames(self):
+        """ Generates the names of all residuals, ordered by row. Names of residual blocks are created on the fly.
+        """
+        blocks = list(self.residual_blocks.values())
+        b = 0
+        for name in self.residuals:
+            while b < len(blocks) and blocks[b].row < self._residual_rows[name]:
+                for name_in_block in self._getResidualBlockNames(blocks[b]):
+                    yield name_in_block
+                b += 1
+            yield name
+
+        for block in blocks[b:]:
+            for name_in_block in self._getResidualBlockNames(block):
+                yield name_in_block
+
+    def _getResidualBlockNames(self, block):
+        for index in range(block.first_index, block.first_index + block.number_of_residuals):
+            yield block.name_template.format(index)
+
+    def _getSortedParamNames(self):
+        if self._sorted_param_names is None:
+            self._sorted_param_names = sorted(self._param_names)
+        return self._sorted_param_names
 
     def fromDataToX(self, x=None):
         """ Copies values of all parameters from the data to the vector x
@@ -470,10 +1837,16 @@ class Optimizer:
         if x is None:
             x = self.x
 
+        matrices = OrderedDict()  # matrices of the rotation and pose groups, converted all at once
         for group_name, group in self.groups.items():
-            values = group.getter(self.data_models[group.data_key])
-            for i, idx in enumerate(group.idx):
-                x[idx] = values[i]
+            if group_name in self.manifold_groups:
+                matrices[group_name] = self.manifold_groups[group_name].getter(self.data_models[group.data_key])
+            else:
+                x[group.idx[0]:group.idx[-1] + 1] = group.getter(self.data_models[group.data_key])
+
+        if matrices:
+            for group_name, values in self._manifoldParams(matrices).items():
+                x[self.groups[group_name].idx[0]:self.groups[group_name].idx[-1] + 1] = values
 
     def fromXToData(self, x=None):
         """ Copies values of all parameters from vector x to the data
@@ -483,26 +1856,42 @@ class Optimizer:
         if x is None:
             x = self.x
 
+        rotations = self._getManifoldRotations(x)  # all at once, faster than one conversion per group
         for group_name, group in self.groups.items():
-            values = []
-            for idx in group.idx:
-                values.append(x[idx])
-
-            group.setter(self.data_models[group.data_key], values)
+            values = x[group.idx[0]:group.idx[-1] + 1].tolist()
+            if group_name in rotations:
+                self._setManifoldParams(self.data_models[group.data_key], values, group_name,
+                                        rotation=rotations[group_name])
+            else:
+                group.setter(self.data_models[group.data_key], values)
 
     def computeSparseMatrix(self):
         """ Computes the sparse matrix given the parameters and the residuals. Should be called only after setting both.
-
+        The matrix is built directly in CSR format: all rows of a residual block share the same columns, so each block
+        is filled with a single tile of its columns.
         """
-        params = self.getParameters()
-        self.sparse_matrix = lil_matrix((len(self.residuals), len(params)), dtype=int)
-
-        for i, key in enumerate(self.residuals):
-            for group_name, group in self.groups.items():
-                for j, param in enumerate(group.param_names):
-                    if param in self.residuals[key]:
-                        idx = group.idx[j]
-                        self.sparse_matrix[i, idx] = 1
+        columns = OrderedDict()  # dict: key={row} value = sorted columns of the row
+        for key, params in self.residuals.items():
+            columns[self._residual_rows[key]] = sorted(set(self._param_columns[param] for param in params))
+        block_columns = [np.unique([self._param_columns[param] for param in block.params]).astype(int)
+                         for block in self.residual_blocks.values()]
+
+        counts = np.zeros((self._number_of_residuals,), dtype=int)  # number of columns of each row
+        counts[list(columns.keys())] = [len(row_columns) for row_columns in columns.values()]
+        for block, row_columns in zip(self.residual_blocks.values(), block_columns):
+            counts[block.row:block.row + block.number_of_residuals] = len(row_columns)
+        indptr = np.concatenate(([0], np.cumsum(counts)))
+
+        index_dtype = np.int32 if indptr[-1] <= np.iinfo(np.int32).max else np.int64
+        indices = np.empty((indptr[-1],), dtype=index_dtype)
+        for row, row_columns in columns.items():
+            indices[indptr[row]:indptr[row + 1]] = row_columns
+        for block, row_columns in zip(self.residual_blocks.values(), block_columns):
+            indices[indptr[block.row]:indptr[block.row + block.number_of_residuals]] = np.tile(
+                row_columns, block.number_of_residuals)
+
+        self.sparse_matrix = csr_matrix((np.ones((len(indices),), dtype=int), indices, indptr.astype(index_dtype)),
+                                        shape=(self._number_of_residuals, self.getNumberOfParameters()))
 
     # ---------------------------
     # Print and display
@@ -525,20 +1914,10 @@ class Optimizer:
         print(self.x)
 
     def getParamNames(self):
-        params = []
-        for group_name in self.groups:
-            for param_name in self.groups[group_name].param_names:
-                params.append(param_name)
-
-        return params
+        return list(self._param_names)
 
     def getNumberOfParameters(self):
-        number_of_parameters = 0
-        for group_name, group in self.groups.items():
-            for i, param_name in enumerate(group.param_names):
-                number_of_parameters += 1
-
-        return number_of_parameters
+        return len(self._param_names)
 
     def printParameters(self, x=None, flg_simple=False, text=None):
         """ Prints the current values of the parameters in the parameter list as well as the corresponding data
@@ -551,8 +1930,8 @@ class Optimizer:
         if x is None:
             x = self.x
 
-        if self.x0 == []:
-            self.x0 = deepcopy(x)
+        if len(self.x0) == 0:
+            self.x0 = np.array(x, dtype=float)
 
         # Build a panda data frame and then print a nice table
         rows = []  # get a list of parameters
@@ -592,10 +1971,10 @@ class Optimizer:
         rows = []  # get a list of residuals
         table = []
         if errors is None:
-            errors = np.full((len(self.residuals)), np.nan)
+            errors = np.full((self._number_of_residuals), np.nan)
             # errors=np.nans((len(self.residuals)))
 
-        for i, residual in enumerate(self.residuals):
+        for i, residual in enumerate(self.getResidualNames()):
             rows.append(residual)
             table.append(errors[i])
 
@@ -605,7 +1984,8 @@ class Optimizer:
 
     def printSparseMatrix(self):
         """ Print to stdout the sparse matrix"""
-        data_frame = pandas.DataFrame(self.sparse_matrix.toarray(), self.residuals, self.getParameters())
+        data_frame = pandas.DataFrame(self.sparse_matrix.toarray(), list(self.getResidualNames()),
+                                      self.getParameters())
         print('Sparsity matrix:')
         print(data_frame)
         data_frame.to_csv('sparse_matrix.csv')
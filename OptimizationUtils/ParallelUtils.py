@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+Tools to evaluate an optimization problem in several processes.
+"""
+
+# -------------------------------------------------------------------------------
+# --- IMPORTS (standard, then third party, then my own modules)
+# -------------------------------------------------------------------------------
+import mmap
+import multiprocessing
+import os
+import tempfile
+from functools import partial
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory  # python 3.8 or newer
+except ImportError:
+    shared_memory = None
+
+# -------------------------------------------------------------------------------
+# --- GLOBALS
+# -------------------------------------------------------------------------------
+_attached_segments = {}  # dict: key={segment name} value = segment, segments attached by this process
+_worker_problem = None  # the problem received by this process when it was started as a worker of a WorkerPool
+
+
+# -------------------------------------------------------------------------------
+# --- CLASSES
+# -------------------------------------------------------------------------------
+class FileSegment(object):
+    """ A shared memory segment backed by a memory mapped file in /dev/shm (a RAM filesystem), used when
+    multiprocessing.shared_memory is not available (python older than 3.8). It has the part of the interface of
+    shared_memory.SharedMemory used by SharedArray. The name of the segment is the path of the file.
+    """
+
+    def __init__(self, name=None, create=False, size=0):
+        if create:
+            directory = '/dev/shm' if os.path.isdir('/dev/shm') else None  # else the default temporary directory
+            fd, name = tempfile.mkstemp(prefix='opt_utils_', dir=directory)
+            os.ftruncate(fd, size)
+        else:
+            fd = os.open(name, os.O_RDWR)
+            size = os.fstat(fd).st_size
+
+        try:
+            self.buf = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)  # the mapping keeps the file open
+        self.name = name
+
+    def close(self):
+        self.buf.close()
+
+    def unlink(self):
+        os.unlink(self.name)
+
+
+_Segment = FileSegment if shared_memory is None else shared_memory.SharedMemory
+
+
+class SharedArray(np.ndarray):
+    """ A numpy array stored in a shared memory segment. Pickling it sends only the name of the segment, its shape and
+    dtype, so a worker process attaches to the segment (once) instead of receiving a copy of the data. Views of a
+    SharedArray are pickled by value.
+    """
+
+    def __new__(cls, array):
+        array = np.ascontiguousarray(array)
+        segment = _Segment(create=True, size=max(array.nbytes, 1))
+        obj = np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf).view(cls)
+        obj[...] = array
+        obj._segment = segment
+        return obj
+
+    def __array_finalize__(self, obj):
+        self._segment = None  # only the array which owns the segment is sent by name, views keep it alive by their base
+
+    def __reduce__(self):
+        if self._segment is None:
+            return np.array(self).__reduce__()  # a view, send the values
+        return attachSharedArray, (self._segment.name, self.shape, self.dtype.str)
+
+    def release(self):
+        """ Frees the shared memory segment. Arrays attached in other processes remain valid until they are deleted.
+        """
+        if self._segment is not None:
+            self._segment.unlink()
+
+
+class WorkerPool(object):
+    """ A pool of long lived processes which receive a problem (e.g. an Optimizer) once, when they start. Afterwards
+    only the arguments of each task and its result are sent between processes.
+    """
+
+    def __init__(self, problem, number_of_workers=None):
+        """
+        :param problem: any picklable object. With the fork start method (default on linux) it is not even pickled.
+        :param number_of_workers: number of processes. If None the number of cpus is used.
+        """
+        self.number_of_workers = number_of_workers or multiprocessing.cpu_count()
+        self._pool = multiprocessing.Pool(self.number_of_workers, initializer=_initializeWorker, initargs=(problem,))
+
+    def map(self, function, args):
+        """ Calls function(problem, arg) in the workers for each arg in args.
+
+        :param function: a function defined at module level, so that it can be sent to the workers.
+        :param args: list of arguments.
+        :return: list of results, in the order of args.
+        """
+        return self._pool.map(partial(_callWorker, function), args)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+
+# -------------------------------------------------------------------------------
+# --- FUNCTIONS
+# -------------------------------------------------------------------------------
+def attachSharedArray(name, shape, dtype):
+    """ Creates a numpy array on an existing shared memory segment. Each segment is attached only once per process.
+
+    :param name: name of the shared memory segment.
+    :param shape: shape of the array.
+    :param dtype: dtype of the array.
+    """
+    if name not in _attached_segments:
+        _attached_segments[name] = _Segment(name=name)
+    array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=_attached_segments[name].buf)
+    array.flags.writeable = False  # the data models are read only for the workers
+    return array
+
+
+def _initializeWorker(problem):
+    global _worker_problem
+    _worker_problem = problem
+
+
+def _callWorker(function, arg):
+    return function(_worker_problem, arg)
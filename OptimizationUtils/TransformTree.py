@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""
+A tree of coordinate frames connected by rigid transformations, with cached transformations to the root frame.
+"""
+
+# -------------------------------------------------------------------------------
+# --- IMPORTS (standard, then third party, then my own modules)
+# -------------------------------------------------------------------------------
+import numpy as np
+
+from . import lie_groups, transformations
+
+
+# -------------------------------------------------------------------------------
+# --- CLASSES
+# -------------------------------------------------------------------------------
+class TransformTree(object):
+    """ Stores, for each frame, the transformation from the frame to its parent, i.e. T(parent<-frame), which maps
+    coordinates in the frame to coordinates in the parent. The transformations from each frame to the root and between
+    pairs of frames are computed once and cached. Changing the transformation of a frame only discards the cached
+    transformations of the frames in its subtree.
+
+    Example, with the transforms of a collection of the calibration json:
+
+        tree = TransformTree('base_link')
+        tree.addTransformsDictionary(data['collections'][collection_key]['transforms'])
+        T = tree.getTransform('base_link', 'top_left_camera')  # T(base_link<-top_left_camera)
+    """
+
+    def __init__(self, root='world'):
+        """
+        :param root: name of the root frame.
+        """
+        self.root = root
+        self.parents = {root: None}  # dict: key={frame} value = parent frame
+        self.children = {root: []}  # dict: key={frame} value = list of child frames
+        self.transforms = {root: np.identity(4)}  # dict: key={frame} value = T(parent<-frame)
+        self._root_transforms = {root: np.identity(4)}  # dict: key={frame} value = cached T(root<-frame)
+        self._pair_transforms = {}  # dict: key={(target frame, source frame)} value = cached T(target<-source)
+        self._pair_keys = {root: set()}  # dict: key={frame} value = keys of the cached pairs which use the frame
+        self._root_transforms[root].flags.writeable = False
+
+    def addFrame(self, frame, parent, transform=None):
+        """ Adds a new frame to the tree.
+
+        :param frame: name of the new frame.
+        :param parent: name of the parent frame, which must already be in the tree.
+        :param transform: 4x4 matrix T(parent<-frame). If None the identity is used.
+        """
+        if frame in self.parents:
+            raise ValueError('Frame ' + str(frame) + ' already exists. Use setTransform to change it.')
+        if parent not in self.parents:
+            raise ValueError('Parent frame ' + str(parent) + ' of ' + str(frame) + ' does not exist.')
+
+        self.parents[frame] = parent
+        self.children[frame] = []
+        self.children[parent].append(frame)
+        self.transforms[frame] = np.identity(4) if transform is None else np.array(transform, dtype=float)
+        self._pair_keys[frame] = set()
+
+    def setTransform(self, frame, transform):
+        """ Changes the transformation from a frame to its parent. Cached transformations which depend on it are
+        discarded. Nothing is discarded if the transformation is the same.
+
+        :param frame: name of the frame.
+        :param transform: 4x4 matrix T(parent<-frame).
+        """
+        if frame not in self.parents or frame == self.root:
+            raise ValueError('Frame ' + str(frame) + ' does not exist or is the root.')
+
+        transform = np.array(transform, dtype=float)
+        if np.array_equal(transform, self.transforms[frame]):
+            return
+        self.transforms[frame] = transform
+        self._invalidate(frame)
+
+    def addTransformsDictionary(self, transforms):
+        """ Adds or changes the frames given by a dictionary with entries {'parent': ..., 'child': ..., 'trans': [x, y,
+        z], 'quat': [x, y, z, w]}, as in the transforms of the collections in the calibration json files. Entries may
+        be in any order. All entries are checked before the tree is changed: ValueError is raised, and the tree is left
+        as it was, if a frame is given with a parent other than the one in the tree or than the one of another entry,
+        or if some parent frame is neither in the tree nor in the dictionary.
+
+        :param transforms: dictionary of transformations, the keys are not used.
+        """
+        parents = {}  # dict: key={frame} value = parent frame given by the entries
+        for entry in transforms.values():
+            child, parent = entry['child'], entry['parent']
+            if child in self.parents and not self.parents[child] == parent:
+                raise ValueError('Frame ' + str(child) + ' has parent ' + str(self.parents[child]) +
+                                 ' in the tree, not ' + str(parent) + '.')
+            if child in parents and not parents[child] == parent:
+                raise ValueError('Frame ' + str(child) + ' is given with parents ' + str(parents[child]) + ' and ' +
+                                 str(parent) + '.')
+            parents[child] = parent
+
+        ordered = []  # entries and their transformations, each parent before its children
+        known_frames = set(self.parents)
+        pending = list(transforms.values())
+        while pending:
+            missing_parents = []
+            for entry in pending:
+                if entry['parent'] not in known_frames:
+                    missing_parents.append(entry)
+                    continue
+                transform = transformations.quaternion_matrix(entry['quat'])
+                transform[0:3, 3] = entry['trans']
+                ordered.append((entry, transform))
+                known_frames.add(entry['child'])
+
+            if len(missing_parents) == len(pending):
+                raise ValueError('Parent frames ' + str(sorted(set(e['parent'] for e in pending))) +
+                                 ' are not in the tree.')
+            pending = missing_parents
+
+        for entry, transform in ordered:
+            if entry['child'] in self.parents:
+                self.setTransform(entry['child'], transform)
+            else:
+                self.addFrame(entry['child'], entry['parent'], transform)
+
+    def getRootTransform(self, frame):
+        """ Returns T(root<-frame), computed once and cached. The returned matrix is read only.
+
+        :param frame: name of the frame.
+        """
+        if frame in self._root_transforms:
+            return self._root_transforms[frame]
+        if frame not in self.parents:
+            raise ValueError('Frame ' + str(frame) + ' does not exist.')
+
+        # walk up to the first frame with a cached transformation, then compute the ones below it
+        path = []
+        while frame not in self._root_transforms:
+            path.append(frame)
+            frame = self.parents[frame]
+        transform = self._root_transforms[frame]
+        for frame in reversed(path):
+            transform = np.dot(transform, self.transforms[frame])
+            transform.flags.writeable = False  # cached, shared by all callers
+            self._root_transforms[frame] = transform
+        return transform
+
+    def getTransform(self, target, source):
+        """ Returns T(target<-source), which maps coordinates in the source frame to coordinates in the target frame.
+        Computed once and cached. The returned matrix is read only.
+
+        :param target: name of the target frame.
+        :param source: name of the source frame.
+        """
+        key = (target, source)
+        if key in self._pair_transforms:
+            return self._pair_transforms[key]
+
+        transform = np.dot(lie_groups.inverse(self.getRootTransform(target)), self.getRootTransform(source))
+        transform.flags.writeable = False  # cached, shared by all callers
+        self._pair_transforms[key] = transform
+        self._pair_keys[target].add(key)
+        self._pair_keys[source].add(key)
+        return transform
+
+    def getSubtree(self, frame):
+        """ Returns the list of frames in the subtree of a frame, including the frame, parents before children.
+
+        :param frame: name of the frame.
+        """
+        subtree = [frame]
+        for f in subtree:  # the list grows while it is traversed
+            subtree.extend(self.children[f])
+        return subtree
+
+    def _invalidate(self, frame):
+        """ Discards the cached transformations of all frames in the subtree of a frame. """
+        for f in self.getSubtree(frame):
+            self._root_transforms.pop(f, None)
+            keys, self._pair_keys[f] = self._pair_keys[f], set()
+            for key in keys:
+                self._pair_transforms.pop(key, None)
+                self._pair_keys[key[0]].discard(key)
+                self._pair_keys[key[1]].discard(key)
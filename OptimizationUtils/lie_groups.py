@@ -0,0 +1,476 @@
+# -*- coding: utf-8 -*-
+# lie_groups.py
+
+"""Batched operations on the SO(3) and SE(3) Lie groups.
+
+Rotations are 3x3 matrices and poses are 4x4 homogeneous matrices, as in
+transformations.py. Every function works on stacks: arrays of shape (N, 3)
+or (N, 6) for tangent vectors, (N, 3, 3) for rotations and (N, 4, 4) for
+poses.
+
+Tangent vectors of SO(3) are rotation vectors, i.e. the axis times the angle,
+as used by cv2.Rodrigues. Tangent vectors of SE(3) are (rho, phi), with the
+translational part rho first and the rotation vector phi last, which is the
+order of the pose parameters in the Optimizer.
+
+The left Jacobian J of exp is such that exp(x + d) = exp(J d) exp(x) for a
+small d, and the right Jacobian such that exp(x + d) = exp(x) exp(J d).
+
+Small angles are handled with the Taylor series of the coefficients, so all
+functions are accurate, and smooth, close to the identity.
+
+>>> phi = numpy.random.random((5, 3)) - 0.5
+>>> R = so3_exp(phi)
+>>> numpy.allclose(so3_log(R), phi)
+True
+>>> T = se3_exp(numpy.random.random((5, 6)) - 0.5)
+>>> numpy.allclose(compose(inverse(T), T), numpy.identity(4))
+True
+
+"""
+
+from __future__ import division
+
+import numpy
+
+__all__ = ['hat', 'vee', 'so3_exp', 'so3_log', 'se3_exp', 'se3_log',
+           'compose', 'inverse', 'act', 'so3_adjoint', 'se3_adjoint',
+           'so3_left_jacobian', 'so3_right_jacobian',
+           'so3_left_jacobian_inverse', 'so3_right_jacobian_inverse',
+           'se3_left_jacobian', 'se3_right_jacobian',
+           'se3_left_jacobian_inverse', 'se3_right_jacobian_inverse']
+
+
+def hat(vectors):
+    """Return stack of skew symmetric matrices of 3D vectors.
+
+    hat(v) is the matrix of the cross product with v.
+
+    >>> v, u = numpy.random.random((2, 5, 3))
+    >>> K = hat(v)
+    >>> numpy.allclose(numpy.matmul(K, u[:, :, None])[:, :, 0],
+    ...                numpy.cross(v, u))
+    True
+
+    """
+    v = numpy.array(vectors, dtype=numpy.float64, ndmin=2)
+    K = numpy.zeros((len(v), 3, 3), dtype=numpy.float64)
+    K[:, 0, 1], K[:, 0, 2], K[:, 1, 2] = -v[:, 2], v[:, 1], -v[:, 0]
+    K[:, 1, 0], K[:, 2, 0], K[:, 2, 1] = v[:, 2], -v[:, 1], v[:, 0]
+    return K
+
+
+def vee(matrices):
+    """Return stack of 3D vectors from skew symmetric matrices.
+
+    Only the antisymmetric part of the matrices is used.
+
+    >>> v = numpy.random.random((5, 3))
+    >>> numpy.allclose(vee(hat(v)), v)
+    True
+
+    """
+    K = numpy.asarray(matrices, dtype=numpy.float64)
+    return 0.5 * numpy.stack((K[:, 2, 1]-K[:, 1, 2], K[:, 0, 2]-K[:, 2, 0],
+                              K[:, 1, 0]-K[:, 0, 1]), axis=1)
+
+
+def so3_exp(phi):
+    """Return stack of rotation matrices from rotation vectors.
+
+    >>> R = so3_exp([[0, 0, numpy.pi/2]])
+    >>> numpy.allclose(R[0], [[0, -1, 0], [1, 0, 0], [0, 0, 1]])
+    True
+    >>> numpy.allclose(so3_exp(numpy.zeros((2, 3))), numpy.identity(3))
+    True
+
+    """
+    phi = numpy.array(phi, dtype=numpy.float64, ndmin=2)
+    theta2 = numpy.sum(phi*phi, axis=1)
+    K = hat(phi)
+    a, b = _coefficients(theta2, _SIN_OVER_THETA, _ONE_MINUS_COS_OVER_THETA2)
+    return (numpy.identity(3) + a[:, None, None] * K +
+            b[:, None, None] * numpy.matmul(K, K))
+
+
+def so3_log(matrices):
+    """Return stack of rotation vectors from rotation matrices.
+
+    The angle of the rotation vectors is in [0, pi]. The rotation part of
+    homogeneous matrices is used.
+
+    >>> phi = numpy.random.random((5, 3)) - 0.5
+    >>> phi[0] = 0.0
+    >>> phi[1] *= (numpy.pi - 1e-9) / numpy.linalg.norm(phi[1])
+    >>> numpy.allclose(so3_log(so3_exp(phi)), phi)
+    True
+
+    """
+    R = numpy.asarray(matrices, dtype=numpy.float64)[:, :3, :3]
+    v = vee(R)  # sin(theta) times the axis
+    sin = numpy.sqrt(numpy.sum(v*v, axis=1))
+    cos = 0.5 * (numpy.trace(R, axis1=1, axis2=2) - 1.0)
+    theta = numpy.arctan2(sin, cos)
+
+    a = _coefficients(theta*theta, _SIN_OVER_THETA)[0]
+    reliable = a > _CLOSE_TO_PI
+    phi = v / numpy.where(reliable, a, 1.0)[:, None]
+
+    # close to pi sin(theta) vanishes and the axis u is obtained from
+    # (R + R^T) / 2 - cos(theta) I = (1 - cos(theta)) u u^T
+    close_to_pi = ~reliable
+    if numpy.any(close_to_pi):
+        Rp, cosp = R[close_to_pi], cos[close_to_pi]
+        S = (0.5 * (Rp + numpy.transpose(Rp, (0, 2, 1))) -
+             cosp[:, None, None] * numpy.identity(3))
+        n = numpy.arange(len(S))
+        i = numpy.argmax(numpy.diagonal(S, axis1=1, axis2=2), axis=1)
+        u = S[n, :, i] / numpy.sqrt(S[n, i, i] * (1.0-cosp))[:, None]
+        u *= numpy.where(numpy.sum(u*v[close_to_pi], axis=1) < 0.0,
+                         -1.0, 1.0)[:, None]
+        phi[close_to_pi] = theta[close_to_pi, None] * u
+    return phi
+
+
+def se3_exp(xi):
+    """Return stack of homogeneous matrices from SE(3) tangent vectors.
+
+    xi : array_like of shape (N, 6) with translational part rho and rotation
+        vector phi.
+
+    The rotation is so3_exp(phi) and the translation so3_left_jacobian(phi)
+    times rho.
+
+    >>> T = se3_exp([[1, 2, 3, 0, 0, 0]])
+    >>> T[0]
+    array([[1., 0., 0., 1.],
+           [0., 1., 0., 2.],
+           [0., 0., 1., 3.],
+           [0., 0., 0., 1.]])
+
+    """
+    xi = numpy.array(xi, dtype=numpy.float64, ndmin=2)
+    T = numpy.zeros((len(xi), 4, 4), dtype=numpy.float64)
+    T[:, :3, :3] = so3_exp(xi[:, 3:])
+    T[:, :3, 3] = _matvec(so3_left_jacobian(xi[:, 3:]), xi[:, :3])
+    T[:, 3, 3] = 1.0
+    return T
+
+
+def se3_log(matrices):
+    """Return stack of SE(3) tangent vectors from homogeneous matrices.
+
+    >>> xi = numpy.random.random((5, 6)) - 0.5
+    >>> numpy.allclose(se3_log(se3_exp(xi)), xi)
+    True
+
+    """
+    T = numpy.asarray(matrices, dtype=numpy.float64)
+    phi = so3_log(T)
+    rho = _matvec(so3_left_jacobian_inverse(phi), T[:, :3, 3])
+    return numpy.concatenate((rho, phi), axis=1)
+
+
+def compose(matrices1, matrices0):
+    """Return stack of products of rotation or homogeneous matrices.
+
+    The result applies matrices0 first. One of the stacks may be a single
+    matrix, which is combined with every matrix of the other stack.
+
+    >>> T0 = se3_exp(numpy.random.random((5, 6)))
+    >>> T1 = se3_exp(numpy.random.random((5, 6)))
+    >>> T = compose(T1, T0)
+    >>> numpy.allclose(T[2], numpy.dot(T1[2], T0[2]))
+    True
+
+    """
+    return numpy.matmul(numpy.asarray(matrices1, dtype=numpy.float64),
+                        numpy.asarray(matrices0, dtype=numpy.float64))
+
+
+def inverse(matrices):
+    """Return stack of inverses of rotation or rigid homogeneous matrices.
+
+    Uses the transposed rotation instead of a general matrix inverse.
+
+    >>> T = se3_exp(numpy.random.random((5, 6)))
+    >>> numpy.allclose(inverse(T), numpy.linalg.inv(T))
+    True
+    >>> R = T[:, :3, :3]
+    >>> numpy.allclose(inverse(R), numpy.linalg.inv(R))
+    True
+
+    """
+    M = numpy.asarray(matrices, dtype=numpy.float64)
+    Rt = numpy.swapaxes(M[..., :3, :3], -1, -2)
+    if M.shape[-1] == 3:
+        return Rt.copy()
+    Mi = numpy.zeros_like(M)
+    Mi[..., :3, :3] = Rt
+    Mi[..., :3, 3] = -numpy.matmul(Rt, M[..., :3, 3:4])[..., 0]
+    Mi[..., 3, 3] = 1.0
+    return Mi
+
+
+def act(matrices, points):
+    """Return points transformed by stack of rotation or rigid matrices.
+
+    matrices : array_like of shape (N, 3, 3) or (N, 4, 4)
+    points : array_like of shape (N, M, 3), or (M, 3) to transform the same
+        points by every matrix
+
+    Return array of shape (N, M, 3).
+
+    >>> T = se3_exp(numpy.random.random((5, 6)))
+    >>> p = numpy.random.random((7, 3))
+    >>> q = act(T, p)
+    >>> numpy.allclose(q[3], numpy.dot(p, T[3, :3, :3].T) + T[3, :3, 3])
+    True
+    >>> numpy.allclose(act(T[:, :3, :3], q - T[:, None, :3, 3]),
+    ...                act(T, q - T[:, None, :3, 3]) - T[:, None, :3, 3])
+    True
+
+    """
+    M = numpy.asarray(matrices, dtype=numpy.float64)
+    p = numpy.asarray(points, dtype=numpy.float64)
+    q = numpy.matmul(p, numpy.swapaxes(M[:, :3, :3], 1, 2))
+    if M.shape[-1] == 4:
+        q += M[:, None, :3, 3]
+    return q
+
+
+def so3_adjoint(matrices):
+    """Return stack of adjoint matrices of rotations, i.e. the rotations.
+
+    >>> R = so3_exp(numpy.random.random((5, 3)))
+    >>> numpy.allclose(so3_adjoint(R), R)
+    True
+
+    """
+    return numpy.array(matrices, dtype=numpy.float64)[:, :3, :3]
+
+
+def se3_adjoint(matrices):
+    """Return stack of 6x6 adjoint matrices of homogeneous matrices.
+
+    The adjoint maps tangent vectors, T exp(xi) = exp(Ad(T) xi) T.
+
+    >>> T = se3_exp(numpy.random.random((5, 6)))
+    >>> xi = numpy.random.random((5, 6))
+    >>> numpy.allclose(compose(T, se3_exp(xi)),
+    ...                compose(se3_exp(_matvec(se3_adjoint(T), xi)), T))
+    True
+
+    """
+    T = numpy.asarray(matrices, dtype=numpy.float64)
+    R = T[:, :3, :3]
+    Ad = numpy.zeros((len(T), 6, 6), dtype=numpy.float64)
+    Ad[:, :3, :3] = R
+    Ad[:, :3, 3:] = numpy.matmul(hat(T[:, :3, 3]), R)
+    Ad[:, 3:, 3:] = R
+    return Ad
+
+
+def so3_left_jacobian(phi):
+    """Return stack of left Jacobians of so3_exp.
+
+    >>> phi, d = numpy.random.random((5, 3)), 1e-7 * numpy.random.random(3)
+    >>> J = so3_left_jacobian(phi)
+    >>> numpy.allclose(so3_exp(phi + d), compose(so3_exp(_matvec(J, d)),
+    ...                                          so3_exp(phi)), atol=1e-12)
+    True
+
+    """
+    phi = numpy.array(phi, dtype=numpy.float64, ndmin=2)
+    K = hat(phi)
+    b, c = _coefficients(numpy.sum(phi*phi, axis=1),
+                         _ONE_MINUS_COS_OVER_THETA2, _THETA_MINUS_SIN_OVER_THETA3)
+    return (numpy.identity(3) + b[:, None, None] * K +
+            c[:, None, None] * numpy.matmul(K, K))
+
+
+def so3_right_jacobian(phi):
+    """Return stack of right Jacobians of so3_exp.
+
+    >>> phi, d = numpy.random.random((5, 3)), 1e-7 * numpy.random.random(3)
+    >>> J = so3_right_jacobian(phi)
+    >>> numpy.allclose(so3_exp(phi + d), compose(so3_exp(phi),
+    ...                so3_exp(_matvec(J, d))), atol=1e-12)
+    True
+
+    """
+    return so3_left_jacobian(-numpy.asarray(phi, dtype=numpy.float64))
+
+
+def so3_left_jacobian_inverse(phi):
+    """Return stack of inverses of the left Jacobians of so3_exp.
+
+    Valid for angles smaller than 2*pi.
+
+    >>> phi = numpy.random.random((5, 3))
+    >>> numpy.allclose(numpy.matmul(so3_left_jacobian_inverse(phi),
+    ...                             so3_left_jacobian(phi)), numpy.identity(3))
+    True
+
+    """
+    phi = numpy.array(phi, dtype=numpy.float64, ndmin=2)
+    theta2 = numpy.sum(phi*phi, axis=1)
+    theta = numpy.sqrt(theta2)
+    small = theta < _THRESHOLD
+    st = numpy.where(small, 1.0, theta)
+    e = numpy.where(small, _polynomial(_INVERSE_JACOBIAN_SERIES, theta2),
+                    (1.0 - 0.5*st*numpy.sin(st)/(1.0-numpy.cos(st))) / st**2)
+    K = hat(phi)
+    return numpy.identity(3) - 0.5*K + e[:, None, None] * numpy.matmul(K, K)
+
+
+def so3_right_jacobian_inverse(phi):
+    """Return stack of inverses of the right Jacobians of so3_exp.
+
+    >>> phi = numpy.random.random((5, 3))
+    >>> numpy.allclose(numpy.matmul(so3_right_jacobian_inverse(phi),
+    ...                so3_right_jacobian(phi)), numpy.identity(3))
+    True
+
+    """
+    return so3_left_jacobian_inverse(-numpy.asarray(phi, dtype=numpy.float64))
+
+
+def se3_left_jacobian(xi):
+    """Return stack of 6x6 left Jacobians of se3_exp.
+
+    >>> xi, d = numpy.random.random((5, 6)), 1e-7 * numpy.random.random(6)
+    >>> J = se3_left_jacobian(xi)
+    >>> numpy.allclose(se3_exp(xi + d), compose(se3_exp(_matvec(J, d)),
+    ...                                         se3_exp(xi)), atol=1e-12)
+    True
+
+    """
+    xi = numpy.array(xi, dtype=numpy.float64, ndmin=2)
+    J = numpy.zeros((len(xi), 6, 6), dtype=numpy.float64)
+    J[:, :3, :3] = J[:, 3:, 3:] = so3_left_jacobian(xi[:, 3:])
+    J[:, :3, 3:] = _se3_q(xi)
+    return J
+
+
+def se3_right_jacobian(xi):
+    """Return stack of 6x6 right Jacobians of se3_exp.
+
+    >>> xi, d = numpy.random.random((5, 6)), 1e-7 * numpy.random.random(6)
+    >>> J = se3_right_jacobian(xi)
+    >>> numpy.allclose(se3_exp(xi + d), compose(se3_exp(xi),
+    ...                se3_exp(_matvec(J, d))), atol=1e-12)
+    True
+
+    """
+    return se3_left_jacobian(-numpy.asarray(xi, dtype=numpy.float64))
+
+
+def se3_left_jacobian_inverse(xi):
+    """Return stack of inverses of the 6x6 left Jacobians of se3_exp.
+
+    >>> xi = numpy.random.random((5, 6))
+    >>> numpy.allclose(numpy.matmul(se3_left_jacobian_inverse(xi),
+    ...                             se3_left_jacobian(xi)), numpy.identity(6))
+    True
+
+    """
+    xi = numpy.array(xi, dtype=numpy.float64, ndmin=2)
+    Ji = so3_left_jacobian_inverse(xi[:, 3:])
+    J = numpy.zeros((len(xi), 6, 6), dtype=numpy.float64)
+    J[:, :3, :3] = J[:, 3:, 3:] = Ji
+    J[:, :3, 3:] = -numpy.matmul(numpy.matmul(Ji, _se3_q(xi)), Ji)
+    return J
+
+
+def se3_right_jacobian_inverse(xi):
+    """Return stack of inverses of the 6x6 right Jacobians of se3_exp.
+
+    >>> xi = numpy.random.random((5, 6))
+    >>> numpy.allclose(numpy.matmul(se3_right_jacobian_inverse(xi),
+    ...                se3_right_jacobian(xi)), numpy.identity(6))
+    True
+
+    """
+    return se3_left_jacobian_inverse(-numpy.asarray(xi, dtype=numpy.float64))
+
+
+# helper functions
+
+def _matvec(matrices, vectors):
+    """Return stack of products of matrices and vectors."""
+    return numpy.matmul(matrices, vectors[..., None])[..., 0]
+
+
+def _polynomial(coefficients, x):
+    """Return sum(coefficients[i] * x**i)."""
+    result = numpy.zeros_like(x)
+    for coefficient in reversed(coefficients):
+        result = result*x + coefficient
+    return result
+
+
+def _coefficients(theta2, *functions):
+    """Return coefficients of the exp map for squared angles theta2.
+
+    Each function is a pair of its Taylor series in theta**2 and a callable
+    of (theta, sin(theta), cos(theta)), used for angles above _THRESHOLD.
+
+    """
+    theta = numpy.sqrt(theta2)
+    small = theta < _THRESHOLD
+    st = numpy.where(small, 1.0, theta)
+    s, c = numpy.sin(st), numpy.cos(st)
+    return [numpy.where(small, _polynomial(series, theta2), function(st, s, c))
+            for series, function in functions]
+
+
+def _se3_q(xi):
+    """Return stack of the upper right 3x3 blocks of se3_left_jacobian."""
+    P, K = hat(xi[:, :3]), hat(xi[:, 3:])
+    KP, PK = numpy.matmul(K, P), numpy.matmul(P, K)
+    KPK = numpy.matmul(KP, K)
+    a, b, c = _coefficients(numpy.sum(xi[:, 3:]**2, axis=1),
+                            _THETA_MINUS_SIN_OVER_THETA3, _Q_SECOND, _Q_THIRD)
+    return (0.5*P + a[:, None, None] * (KP + PK + KPK) +
+            b[:, None, None] * (numpy.matmul(K, KP) + numpy.matmul(PK, K) -
+                                3.0*KPK) +
+            c[:, None, None] * (numpy.matmul(KPK, K) + numpy.matmul(K, KPK)))
+
+
+# below this angle the coefficients are computed from their Taylor series,
+# whose closed forms lose precision by cancellation
+_THRESHOLD = 0.5
+
+# below this value of sin(theta)/theta so3_log takes the axis from the
+# symmetric part of the matrix
+_CLOSE_TO_PI = 0.1
+
+# coefficients as pairs of Taylor series in theta**2 and closed forms
+_SIN_OVER_THETA = (
+    [1.0, -1/6, 1/120, -1/5040, 1/362880, -1/39916800, 1/6227020800],
+    lambda t, s, c: s / t)
+_ONE_MINUS_COS_OVER_THETA2 = (
+    [1/2, -1/24, 1/720, -1/40320, 1/3628800, -1/479001600,
+     1/87178291200],
+    lambda t, s, c: (1.0-c) / t**2)
+_THETA_MINUS_SIN_OVER_THETA3 = (
+    [1/6, -1/120, 1/5040, -1/362880, 1/39916800, -1/6227020800,
+     1/1307674368000],
+    lambda t, s, c: (t-s) / t**3)
+_Q_SECOND = (
+    [1/24, -1/720, 1/40320, -1/3628800, 1/479001600, -1/87178291200,
+     1/20922789888000],
+    lambda t, s, c: (t*t + 2.0*c - 2.0) / (2.0 * t**4))
+_Q_THIRD = (
+    [1/120, -1/2520, 1/120960, -1/9979200, 1/1245404160, -1/217945728000,
+     1/50812489728000],
+    lambda t, s, c: (2.0*t - 3.0*s + t*c) / (2.0 * t**5))
+_INVERSE_JACOBIAN_SERIES = [1/12, 1/720, 1/30240, 1/1209600, 1/47900160,
+                            691/1307674368000, 1/74724249600]
+
+
+if __name__ == "__main__":
+    import doctest
+    numpy.set_printoptions(suppress=True, precision=5)
+    doctest.testmod()
@@ -173,6 +173,8 @@ import math
 
 import numpy
 
+from . import lie_groups
+
 
 # Documentation in HTML format can be generated with Epydoc
 __docformat__ = "restructuredtext en"
@@ -206,6 +208,27 @@ def translation_matrix(direction):
     return M
 
 
+def translation_matrix_jacobian(directions):
+    """Return derivatives of translation matrices by the direction vectors.
+
+    directions : array_like of shape (3,) or (N, 3)
+
+    Return array of shape (4, 4, 3), respectively (N, 4, 4, 3), whose last
+    axis indexes the elements of the direction vector.
+
+    >>> J = translation_matrix_jacobian(numpy.random.random((5, 3)))
+    >>> J.shape
+    (5, 4, 4, 3)
+    >>> numpy.allclose(J[2, :3, 3, :], numpy.identity(3))
+    True
+
+    """
+    v = numpy.asarray(directions, dtype=numpy.float64)
+    J = numpy.zeros(v.shape[:-1] + (4, 4, 3), dtype=numpy.float64)
+    J[..., [0, 1, 2], 3, [0, 1, 2]] = 1.0
+    return J
+
+
 def translation_from_matrix(matrix):
     """Return translation vector from translation matrix.
 
@@ -783,6 +806,121 @@ def decompose_matrix(matrix):
     return scale, shear, angles, translate, perspective
 
 
+def decompose_matrix_batch(matrices):
+    """Return stacks of transformations from stack of transformation matrices.
+
+    matrices : array_like of shape (N, 4, 4)
+        Non-degenerative homogeneous transformation matrices
+
+    Return tuple of arrays with one row per matrix, with the values returned
+    by decompose_matrix for each matrix:
+        scale : (N, 3) scaling factors
+        shear : (N, 3) shear factors for x-y, x-z, y-z axes
+        angles : (N, 3) Euler angles about static x, y, z axes
+        translate : (N, 3) translation vectors along x, y, z axes
+        perspective : (N, 4) perspective partitions of the matrices
+
+    Raise ValueError if any matrix is degenerative.
+
+    >>> scale = numpy.random.random((5, 3)) - 0.5
+    >>> shear = numpy.random.random((5, 3)) - 0.5
+    >>> angles = (numpy.random.random((5, 3)) - 0.5) * (2*math.pi)
+    >>> trans = numpy.random.random((5, 3)) - 0.5
+    >>> persp = numpy.random.random((5, 4)) - 0.5
+    >>> M = compose_matrix_batch(scale, shear, angles, trans, persp)
+    >>> M[1] = euler_matrix(1, 2, 3)
+    >>> result = decompose_matrix_batch(M)
+    >>> all(numpy.allclose(result[i][n], decompose_matrix(M[n])[i])
+    ...     for i in range(5) for n in range(5))
+    True
+    >>> numpy.allclose(compose_matrix_batch(*result), M)
+    True
+
+    """
+    M = numpy.array(matrices, dtype=numpy.float64, ndmin=3)
+    M = numpy.swapaxes(M, 1, 2).copy()
+    if numpy.any(numpy.abs(M[:, 3, 3]) < _EPS):
+        raise ValueError("M[3, 3] is zero")
+    M /= M[:, 3, 3][:, numpy.newaxis, numpy.newaxis]
+    P = M.copy()
+    P[:, :, 3] = 0, 0, 0, 1
+    if not numpy.all(numpy.linalg.det(P)):
+        raise ValueError("Matrix is singular")
+
+    has_perspective = numpy.any(numpy.abs(M[:, :3, 3]) > _EPS, axis=1)
+    perspective = numpy.zeros((len(M), 4), dtype=numpy.float64)
+    perspective[:, 3] = 1.0
+    if numpy.any(has_perspective):
+        perspective[has_perspective] = numpy.linalg.solve(
+            P[has_perspective], M[has_perspective, :, 3:4])[:, :, 0]
+
+    translate = M[:, 3, :3].copy()
+
+    row = M[:, :3, :3].copy()
+    scale = numpy.zeros((len(M), 3), dtype=numpy.float64)
+    shear = numpy.zeros((len(M), 3), dtype=numpy.float64)
+    scale[:, 0] = vector_norm(row[:, 0], axis=1)
+    row[:, 0] /= scale[:, 0, numpy.newaxis]
+    shear[:, 0] = numpy.sum(row[:, 0] * row[:, 1], axis=1)
+    row[:, 1] -= row[:, 0] * shear[:, 0, numpy.newaxis]
+    scale[:, 1] = vector_norm(row[:, 1], axis=1)
+    row[:, 1] /= scale[:, 1, numpy.newaxis]
+    shear[:, 0] /= scale[:, 1]
+    shear[:, 1] = numpy.sum(row[:, 0] * row[:, 2], axis=1)
+    row[:, 2] -= row[:, 0] * shear[:, 1, numpy.newaxis]
+    shear[:, 2] = numpy.sum(row[:, 1] * row[:, 2], axis=1)
+    row[:, 2] -= row[:, 1] * shear[:, 2, numpy.newaxis]
+    scale[:, 2] = vector_norm(row[:, 2], axis=1)
+    row[:, 2] /= scale[:, 2, numpy.newaxis]
+    shear[:, 1:] /= scale[:, 2, numpy.newaxis]
+
+    flip = numpy.sum(row[:, 0] * numpy.cross(row[:, 1], row[:, 2]),
+                     axis=1) < 0
+    scale[flip] *= -1
+    row[flip] *= -1
+
+    angles = numpy.zeros((len(M), 3), dtype=numpy.float64)
+    angles[:, 1] = numpy.arcsin(numpy.clip(-row[:, 0, 2], -1.0, 1.0))
+    regular = numpy.cos(angles[:, 1]) != 0.0
+    angles[:, 0] = numpy.where(regular,
+                               numpy.arctan2(row[:, 1, 2], row[:, 2, 2]),
+                               numpy.arctan2(-row[:, 2, 1], row[:, 1, 1]))
+    angles[:, 2] = numpy.where(regular,
+                               numpy.arctan2(row[:, 0, 1], row[:, 0, 0]), 0.0)
+
+    return scale, shear, angles, translate, perspective
+
+
+def decompose_rigid_matrix_batch(matrices, axes='sxyz'):
+    """Return translations, Euler angles and quaternions of stack of rigid
+    transformation matrices.
+
+    matrices : array_like of shape (N, 4, 4)
+    axes : One of 24 axis sequences as string or encoded tuple
+
+    Return tuple of arrays of shape (N, 3), (N, 3) and (N, 4), equal to
+    translation_from_matrix, euler_from_matrix and quaternion_from_matrix
+    of each matrix. Faster than decompose_matrix_batch, which also handles
+    scale, shear and perspective.
+
+    >>> M = numpy.array([random_rotation_matrix() for n in range(5)])
+    >>> M[:, :3, 3] = numpy.random.random((5, 3))
+    >>> trans, angles, quats = decompose_rigid_matrix_batch(M, 'rzxy')
+    >>> all(numpy.allclose(angles[n], euler_from_matrix(M[n], 'rzxy'))
+    ...     for n in range(5))
+    True
+    >>> all(numpy.allclose(quats[n], quaternion_from_matrix(M[n]))
+    ...     for n in range(5))
+    True
+    >>> numpy.allclose(trans, M[:, :3, 3])
+    True
+
+    """
+    M = numpy.array(matrices, dtype=numpy.float64, ndmin=3)
+    return (M[:, :3, 3].copy(), euler_from_matrix_batch(M, axes),
+            quaternion_from_matrix_batch(M))
+
+
 def compose_matrix(scale=None, shear=None, angles=None, translate=None,
                    perspective=None):
     """Return transformation matrix from sequence of transformations.
@@ -836,6 +974,146 @@ def compose_matrix(scale=None, shear=None, angles=None, translate=None,
     return M
 
 
+def compose_matrix_batch(scale=None, shear=None, angles=None, translate=None,
+                         perspective=None):
+    """Return stack of transformation matrices from stacks of transformations.
+
+    Each transformation is None or an array_like with one row per matrix,
+    with the columns of the corresponding argument of compose_matrix.
+    Angles are Euler angles about static x, y, z axes.
+
+    >>> scale = numpy.random.random((5, 3)) - 0.5
+    >>> shear = numpy.random.random((5, 3)) - 0.5
+    >>> angles = (numpy.random.random((5, 3)) - 0.5) * (2*math.pi)
+    >>> trans = numpy.random.random((5, 3)) - 0.5
+    >>> persp = numpy.random.random((5, 4)) - 0.5
+    >>> M = compose_matrix_batch(scale, shear, angles, trans, persp)
+    >>> all(numpy.allclose(M[n], compose_matrix(scale[n], shear[n], angles[n],
+    ...     trans[n], persp[n])) for n in range(5))
+    True
+    >>> M = compose_matrix_batch(angles=angles, translate=trans)
+    >>> all(numpy.allclose(M[n], compose_matrix(angles=angles[n],
+    ...     translate=trans[n])) for n in range(5))
+    True
+
+    """
+    given = [numpy.array(t, dtype=numpy.float64, ndmin=2) for t in
+             (scale, shear, angles, translate, perspective) if t is not None]
+    number_of_matrices = len(given[0]) if given else 1
+
+    M = numpy.zeros((number_of_matrices, 4, 4), dtype=numpy.float64)
+    M[:] = numpy.identity(4)
+    if perspective is not None:
+        M[:, 3, :] = numpy.array(perspective, dtype=numpy.float64,
+                                 ndmin=2)[:, :4]
+    if translate is not None:
+        T = numpy.zeros_like(M)
+        T[:] = numpy.identity(4)
+        T[:, :3, 3] = numpy.array(translate, dtype=numpy.float64,
+                                  ndmin=2)[:, :3]
+        M = numpy.matmul(M, T)
+    if angles is not None:
+        M = numpy.matmul(M, euler_matrix_batch(angles, 'sxyz'))
+    if shear is not None:
+        shear = numpy.array(shear, dtype=numpy.float64, ndmin=2)
+        Z = numpy.zeros_like(M)
+        Z[:] = numpy.identity(4)
+        Z[:, 1, 2] = shear[:, 2]
+        Z[:, 0, 2] = shear[:, 1]
+        Z[:, 0, 1] = shear[:, 0]
+        M = numpy.matmul(M, Z)
+    if scale is not None:
+        scale = numpy.array(scale, dtype=numpy.float64, ndmin=2)
+        M[:, :, :3] *= scale[:, numpy.newaxis, :3]
+    M /= M[:, 3, 3][:, numpy.newaxis, numpy.newaxis]
+    return M
+
+
+def compose_matrix_jacobian(scale=None, shear=None, angles=None,
+                            translate=None, perspective=None):
+    """Return derivatives of compose_matrix_batch by its parameters.
+
+    Arguments are as in compose_matrix_batch. The last axis of the returned
+    array of shape (N, 4, 4, k) indexes the elements of the arguments which
+    are not None, in the order scale, shear, angles, translate, perspective.
+
+    >>> scale = numpy.random.random((5, 3)) + 0.5
+    >>> shear = numpy.random.random((5, 3)) - 0.5
+    >>> angles = (numpy.random.random((5, 3)) - 0.5) * (2*math.pi)
+    >>> trans = numpy.random.random((5, 3)) - 0.5
+    >>> persp = numpy.random.random((5, 4)) - 0.5
+    >>> persp[:, 3] += 2.0
+    >>> x = numpy.concatenate((scale, shear, angles, trans, persp), axis=1)
+    >>> def M(x):
+    ...     return compose_matrix_batch(x[:, 0:3], x[:, 3:6], x[:, 6:9],
+    ...                                 x[:, 9:12], x[:, 12:16])
+    >>> J = compose_matrix_jacobian(scale, shear, angles, trans, persp)
+    >>> d = 1e-6 * numpy.identity(16)
+    >>> all(numpy.allclose(J[..., m], (M(x + d[m]) - M(x - d[m])) / 2e-6,
+    ...     atol=1e-8) for m in range(16))
+    True
+    >>> compose_matrix_jacobian(angles=angles, translate=trans).shape
+    (5, 4, 4, 6)
+
+    """
+    given = [numpy.array(t, dtype=numpy.float64, ndmin=2) for t in
+             (scale, shear, angles, translate, perspective) if t is not None]
+    number_of_matrices = len(given[0]) if given else 1
+
+    # factors of the product M = P * T * R * Z * S, each with its derivative
+    factors = []
+    if perspective is not None:
+        P = numpy.zeros((number_of_matrices, 4, 4), dtype=numpy.float64)
+        P[:] = numpy.identity(4)
+        P[:, 3, :] = numpy.array(perspective, dtype=numpy.float64,
+                                 ndmin=2)[:, :4]
+        dP = numpy.zeros((number_of_matrices, 4, 4, 4), dtype=numpy.float64)
+        dP[:, 3, [0, 1, 2, 3], [0, 1, 2, 3]] = 1.0
+        factors.append((P, dP))
+    if translate is not None:
+        translate = numpy.array(translate, dtype=numpy.float64, ndmin=2)
+        factors.append((compose_matrix_batch(translate=translate),
+                        translation_matrix_jacobian(translate[:, :3])))
+    if angles is not None:
+        factors.append((euler_matrix_batch(angles, 'sxyz'),
+                        euler_matrix_jacobian(
+                            numpy.array(angles, dtype=numpy.float64,
+                                        ndmin=2), 'sxyz')))
+    if shear is not None:
+        dZ = numpy.zeros((number_of_matrices, 4, 4, 3), dtype=numpy.float64)
+        dZ[:, [0, 0, 1], [1, 2, 2], [0, 1, 2]] = 1.0
+        factors.append((compose_matrix_batch(shear=shear), dZ))
+    if scale is not None:
+        dS = numpy.zeros((number_of_matrices, 4, 4, 3), dtype=numpy.float64)
+        dS[:, [0, 1, 2], [0, 1, 2], [0, 1, 2]] = 1.0
+        factors.append((compose_matrix_batch(scale=scale), dS))
+    factors.reverse()  # the order of the parameters
+
+    # product rule, with the products of the factors before and after each
+    identity = numpy.zeros((number_of_matrices, 4, 4), dtype=numpy.float64)
+    identity[:] = numpy.identity(4)
+    suffixes = [identity]
+    for F, _ in factors[:-1]:
+        suffixes.append(numpy.matmul(F, suffixes[-1]))
+    prefix = identity
+    derivatives = []
+    for (F, dF), suffix in reversed(list(zip(factors, suffixes))):
+        dF = numpy.moveaxis(dF, -1, 1)  # (N, k, 4, 4)
+        derivatives.insert(0, numpy.matmul(
+            numpy.matmul(prefix[:, numpy.newaxis], dF),
+            suffix[:, numpy.newaxis]))
+        prefix = numpy.matmul(prefix, F)
+    M = prefix
+    if not derivatives:
+        return numpy.zeros((number_of_matrices, 4, 4, 0), dtype=numpy.float64)
+    dM = numpy.moveaxis(numpy.concatenate(derivatives, axis=1), 1, -1)
+
+    # derivative of M / M[3, 3]
+    w = M[:, 3, 3][:, numpy.newaxis, numpy.newaxis, numpy.newaxis]
+    dw = dM[:, 3:4, 3:4, :]
+    return dM / w - M[..., numpy.newaxis] * dw / (w * w)
+
+
 def orthogonalization_matrix(lengths, angles):
     """Return orthogonalization matrix for crystallographic cell coordinates.
 
@@ -923,9 +1201,138 @@ def superimposition_matrix(v0, v1, scaling=False, usesvd=True):
     v0 = v0 - t0.reshape(3, 1)
     v1 = v1 - t1.reshape(3, 1)
 
+    return _superimposition_from_covariance(
+        numpy.dot(v1, v0.T), t0, t1, numpy.sum(v0 * v0), numpy.sum(v1 * v1),
+        scaling, usesvd)
+
+
+def superimposition_matrix_chunked(v0, v1, weights=None, scaling=False,
+                                   usesvd=True, chunk_size=1048576):
+    """Return matrix to transform given vector set into second vector set.
+
+    Same as superimposition_matrix, for vector sets too large to be copied.
+    The vectors are read in chunks of chunk_size columns, so v0 and v1 can be
+    memory-mapped arrays, e.g. numpy.load(filename, mmap_mode='r'), of any
+    float type. Arrays of shape (N, 3) can be given as their transpose.
+
+    weights : array_like of shape (N,) with non negative weights of the
+        vector pairs, or None for equal weights.
+
+    >>> v0 = (numpy.random.rand(4, 100) - 0.5) * 20.0
+    >>> v0[3] = 1.0
+    >>> M = concatenate_matrices(translation_matrix([1, 2, 3]),
+    ...                          random_rotation_matrix(), scale_matrix(2.0))
+    >>> v1 = numpy.dot(M, v0)
+    >>> M0 = superimposition_matrix(v0, v1, scaling=True)
+    >>> M1 = superimposition_matrix_chunked(v0, v1, scaling=True,
+    ...                                     chunk_size=7)
+    >>> numpy.allclose(M0, M1)
+    True
+    >>> M1 = superimposition_matrix_chunked(v0, v1, scaling=True,
+    ...                                     usesvd=False, chunk_size=7)
+    >>> numpy.allclose(M0, M1)
+    True
+    >>> v1[:3] += numpy.random.normal(0.0, 0.1, 300).reshape(3, -1)
+    >>> w = numpy.random.randint(0, 3, 100)
+    >>> M0 = superimposition_matrix(numpy.repeat(v0, w, axis=1),
+    ...                             numpy.repeat(v1, w, axis=1))
+    >>> M1 = superimposition_matrix_chunked(v0.astype(numpy.float32),
+    ...                                     v1.astype(numpy.float32), w)
+    >>> numpy.allclose(M0, M1, atol=1e-5)
+    True
+
+    """
+    v0 = numpy.asarray(v0)
+    v1 = numpy.asarray(v1)
+    if v0.shape != v1.shape or v0.ndim != 2 or v0.shape[0] < 3:
+        raise ValueError("Vector sets are of wrong shape or type.")
+    if weights is not None and numpy.shape(weights) != (v0.shape[1],):
+        raise ValueError("Weights are of wrong shape.")
+
+    def chunks():
+        for start in range(0, v0.shape[1], chunk_size):
+            stop = start + chunk_size
+            yield (v0[:3, start:stop], v1[:3, start:stop],
+                   None if weights is None else weights[start:stop])
+
+    return superimposition_matrix_from_chunks(chunks(), scaling, usesvd)
+
+
+def superimposition_matrix_from_chunks(chunks, scaling=False, usesvd=True):
+    """Return matrix to transform vector set into second vector set.
+
+    chunks : iterable of (v0, v1) or (v0, v1, weights) tuples with parts of
+        the vector sets, v0 and v1 as in superimposition_matrix and weights
+        as in superimposition_matrix_chunked. E.g. a generator reading the
+        vector sets from files.
+
+    Only one chunk is in memory at a time. The cross-covariance is
+    accumulated in a single pass, relative to the centroids of the first
+    chunk to keep the precision for vector sets far from the origin.
+
+    >>> v0 = numpy.random.rand(3, 100) + 1000.0
+    >>> v1 = numpy.dot(random_rotation_matrix()[:3, :3], v0) - 2000.0
+    >>> M0 = superimposition_matrix(v0, v1)
+    >>> M1 = superimposition_matrix_from_chunks((v0[:, i:i+30], v1[:, i:i+30])
+    ...                                         for i in range(0, 100, 30))
+    >>> numpy.allclose(M0, M1)
+    True
+
+    """
+    reference = None
+    count = 0
+    weight = 0.0
+    sum0, sum1 = numpy.zeros(3), numpy.zeros(3)
+    covariance = numpy.zeros((3, 3))
+    squares0 = squares1 = 0.0
+    for chunk in chunks:
+        c0 = numpy.array(chunk[0], dtype=numpy.float64)[:3]
+        c1 = numpy.array(chunk[1], dtype=numpy.float64)[:3]
+        if c0.shape != c1.shape or c0.shape[0] != 3:
+            raise ValueError("Vector sets are of wrong shape or type.")
+        if c0.shape[1] == 0:
+            continue
+        if len(chunk) > 2 and chunk[2] is not None:
+            w = numpy.asarray(chunk[2], dtype=numpy.float64)
+        else:
+            w = numpy.ones(c0.shape[1])
+        if w.shape != (c0.shape[1],) or numpy.any(w < 0.0):
+            raise ValueError("Weights are of wrong shape or negative.")
+        if reference is None:
+            reference = (numpy.mean(c0, axis=1), numpy.mean(c1, axis=1))
+        c0 -= reference[0].reshape(3, 1)
+        c1 -= reference[1].reshape(3, 1)
+        count += c0.shape[1]
+        weight += numpy.sum(w)
+        sum0 += numpy.dot(c0, w)
+        sum1 += numpy.dot(c1, w)
+        covariance += numpy.dot(c1 * w, c0.T)
+        squares0 += numpy.dot(numpy.sum(c0 * c0, axis=0), w)
+        squares1 += numpy.dot(numpy.sum(c1 * c1, axis=0), w)
+
+    if count < 3 or weight <= 0.0:
+        raise ValueError("Vector sets are of wrong shape or type.")
+
+    # move centroids to origin
+    m0 = sum0 / weight
+    m1 = sum1 / weight
+    return _superimposition_from_covariance(
+        covariance - weight * numpy.outer(m1, m0),
+        reference[0] + m0, reference[1] + m1,
+        squares0 - weight * numpy.dot(m0, m0),
+        squares1 - weight * numpy.dot(m1, m1), scaling, usesvd)
+
+
+def _superimposition_from_covariance(H, t0, t1, squares0, squares1, scaling,
+                                     usesvd):
+    """Return superimposition matrix from the cross-covariance H = v1 * v0.T
+    of the centered vector sets, their centroids t0 and t1 and their sums
+    of squares.
+
+    """
     if usesvd:
         # Singular Value Decomposition of covariance matrix
-        u, s, vh = numpy.linalg.svd(numpy.dot(v1, v0.T))
+        u, s, vh = numpy.linalg.svd(H)
         # rotation matrix from SVD orthonormal bases
         R = numpy.dot(u, vh)
         if numpy.linalg.det(R) < 0.0:
@@ -937,9 +1344,9 @@ def superimposition_matrix(v0, v1, scaling=False, usesvd=True):
         M[:3, :3] = R
     else:
         # compute symmetric matrix N
-        xx, yy, zz = numpy.sum(v0 * v1, axis=1)
-        xy, yz, zx = numpy.sum(v0 * numpy.roll(v1, -1, axis=0), axis=1)
-        xz, yx, zy = numpy.sum(v0 * numpy.roll(v1, -2, axis=0), axis=1)
+        xx, yy, zz = H[0, 0], H[1, 1], H[2, 2]
+        xy, yz, zx = H[1, 0], H[2, 1], H[0, 2]
+        xz, yx, zy = H[2, 0], H[0, 1], H[1, 2]
         N = ((xx+yy+zz, yz-zy,    zx-xz,    xy-yx),
              (yz-zy,    xx-yy-zz, xy+yx,    zx+xz),
              (zx-xz,    xy+yx,   -xx+yy-zz, yz+zy),
@@ -954,9 +1361,7 @@ def superimposition_matrix(v0, v1, scaling=False, usesvd=True):
 
     # scale: ratio of rms deviations from centroid
     if scaling:
-        v0 *= v0
-        v1 *= v1
-        M[:3, :3] *= math.sqrt(numpy.sum(v1) / numpy.sum(v0))
+        M[:3, :3] *= math.sqrt(squares1 / squares0)
 
     # translation
     M[:3, 3] = t1
@@ -1029,6 +1434,122 @@ def euler_matrix(ai, aj, ak, axes='sxyz'):
     return M
 
 
+def euler_matrix_batch(angles, axes='sxyz'):
+    """Return stack of homogeneous rotation matrices from Euler angles.
+
+    angles : array_like of shape (N, 3) with roll, pitch and yaw angles
+    axes : One of 24 axis sequences as string or encoded tuple
+
+    >>> angles = (4.0*math.pi) * (numpy.random.random((5, 3)) - 0.5)
+    >>> for axes in list(_AXES2TUPLE.keys()) + list(_TUPLE2AXES.keys()):
+    ...    R = euler_matrix_batch(angles, axes)
+    ...    for n in range(5):
+    ...        if not numpy.allclose(R[n], euler_matrix(axes=axes, *angles[n])):
+    ...            print(axes)
+    >>> euler_matrix_batch([[1, 2, 3]]).shape
+    (1, 4, 4)
+
+    """
+    try:
+        firstaxis, parity, repetition, frame = _AXES2TUPLE[axes]
+    except (AttributeError, KeyError):
+        _ = _TUPLE2AXES[axes]
+        firstaxis, parity, repetition, frame = axes
+
+    i = firstaxis
+    j = _NEXT_AXIS[i+parity]
+    k = _NEXT_AXIS[i-parity+1]
+
+    angles = numpy.array(angles, dtype=numpy.float64, ndmin=2)
+    ai, aj, ak = angles[:, 0], angles[:, 1], angles[:, 2]
+    if frame:
+        ai, ak = ak, ai
+    if parity:
+        ai, aj, ak = -ai, -aj, -ak
+
+    si, sj, sk = numpy.sin(ai), numpy.sin(aj), numpy.sin(ak)
+    ci, cj, ck = numpy.cos(ai), numpy.cos(aj), numpy.cos(ak)
+    cc, cs = ci*ck, ci*sk
+    sc, ss = si*ck, si*sk
+
+    M = numpy.zeros((len(angles), 4, 4), dtype=numpy.float64)
+    M[:, 3, 3] = 1.0
+    if repetition:
+        M[:, i, i] = cj
+        M[:, i, j] = sj*si
+        M[:, i, k] = sj*ci
+        M[:, j, i] = sj*sk
+        M[:, j, j] = -cj*ss+cc
+        M[:, j, k] = -cj*cs-sc
+        M[:, k, i] = -sj*ck
+        M[:, k, j] = cj*sc+cs
+        M[:, k, k] = cj*cc-ss
+    else:
+        M[:, i, i] = cj*ck
+        M[:, i, j] = sj*sc-cs
+        M[:, i, k] = sj*cc+ss
+        M[:, j, i] = cj*sk
+        M[:, j, j] = sj*ss+cc
+        M[:, j, k] = sj*cs-sc
+        M[:, k, i] = -sj
+        M[:, k, j] = cj*si
+        M[:, k, k] = cj*ci
+    return M
+
+
+def euler_matrix_jacobian(angles, axes='sxyz'):
+    """Return derivatives of Euler angle rotation matrices by the angles.
+
+    angles : array_like of shape (3,) or (N, 3) with roll, pitch and yaw
+    axes : One of 24 axis sequences as string or encoded tuple
+
+    Return array of shape (4, 4, 3), respectively (N, 4, 4, 3), whose last
+    axis indexes the angles.
+
+    >>> angles = (4.0*math.pi) * (numpy.random.random((5, 3)) - 0.5)
+    >>> d = 1e-6 * numpy.identity(3)
+    >>> for axes in list(_AXES2TUPLE.keys()) + list(_TUPLE2AXES.keys()):
+    ...    J = euler_matrix_jacobian(angles, axes)
+    ...    for m in range(3):
+    ...        D = (euler_matrix_batch(angles + d[m], axes) -
+    ...             euler_matrix_batch(angles - d[m], axes)) / 2e-6
+    ...        if not numpy.allclose(J[..., m], D, atol=1e-8):
+    ...            print(axes)
+    >>> euler_matrix_jacobian([1, 2, 3]).shape
+    (4, 4, 3)
+
+    """
+    try:
+        firstaxis, parity, repetition, frame = _AXES2TUPLE[axes]
+    except (AttributeError, KeyError):
+        _ = _TUPLE2AXES[axes]
+        firstaxis, parity, repetition, frame = axes
+
+    i = firstaxis
+    j = _NEXT_AXIS[i+parity]
+    k = i if repetition else _NEXT_AXIS[i-parity+1]
+
+    # The matrix is the product of rotations about axes k, j and i,
+    # M = Rk(ak) * Rj(aj) * Ri(ai), and the derivative of a rotation about
+    # an axis u is hat(u) times the rotation, so
+    # dM/dai = M * hat(ui), dM/daj = hat(Rk(ak) uj) * M, dM/dak = hat(uk) * M
+    a = numpy.array(angles, dtype=numpy.float64, ndmin=2)
+    M = euler_matrix_batch(a, axes)[:, :3, :3]
+    ai, ak = (a[:, 2], a[:, 0]) if frame else (a[:, 0], a[:, 2])
+
+    U = numpy.identity(3)
+    uj = (numpy.cos(ak)[:, numpy.newaxis] * U[j] +
+          numpy.sin(ak)[:, numpy.newaxis] * numpy.cross(U[k], U[j]))
+
+    J = numpy.zeros((len(a), 4, 4, 3), dtype=numpy.float64)
+    J[:, :3, :3, 2 if frame else 0] = numpy.matmul(M, lie_groups.hat(U[i]))
+    J[:, :3, :3, 1] = numpy.matmul(lie_groups.hat(uj), M)
+    J[:, :3, :3, 0 if frame else 2] = numpy.matmul(lie_groups.hat(U[k]), M)
+    if numpy.ndim(angles) == 1:
+        return J[0]
+    return J
+
+
 def euler_from_matrix(matrix, axes='sxyz'):
     """Return Euler angles from rotation matrix for specified axis sequence.
 
@@ -1087,6 +1608,59 @@ def euler_from_matrix(matrix, axes='sxyz'):
     return ax, ay, az
 
 
+def euler_from_matrix_batch(matrices, axes='sxyz'):
+    """Return Euler angles from stack of rotation matrices.
+
+    matrices : array_like of shape (N, 3, 3) or (N, 4, 4)
+    axes : One of 24 axis sequences as string or encoded tuple
+
+    Return array of shape (N, 3), equal to euler_from_matrix of each matrix.
+
+    >>> angles = (4.0*math.pi) * (numpy.random.random((5, 3)) - 0.5)
+    >>> angles[0] = (0.5, math.pi/2, 0.3)
+    >>> for axes in _AXES2TUPLE.keys():
+    ...    R = euler_matrix_batch(angles, axes)
+    ...    A = euler_from_matrix_batch(R, axes)
+    ...    for n in range(5):
+    ...        if not numpy.allclose(A[n], euler_from_matrix(R[n], axes)):
+    ...            print(axes)
+    ...    if not numpy.allclose(R, euler_matrix_batch(A, axes)):
+    ...        print(axes)
+
+    """
+    try:
+        firstaxis, parity, repetition, frame = _AXES2TUPLE[axes.lower()]
+    except (AttributeError, KeyError):
+        _ = _TUPLE2AXES[axes]
+        firstaxis, parity, repetition, frame = axes
+
+    i = firstaxis
+    j = _NEXT_AXIS[i+parity]
+    k = _NEXT_AXIS[i-parity+1]
+
+    M = numpy.asarray(matrices, dtype=numpy.float64)[:, :3, :3]
+    if repetition:
+        sy = numpy.sqrt(M[:, i, j]*M[:, i, j] + M[:, i, k]*M[:, i, k])
+        regular = sy > _EPS
+        ax = numpy.where(regular, numpy.arctan2(M[:, i, j], M[:, i, k]),
+                         numpy.arctan2(-M[:, j, k], M[:, j, j]))
+        ay = numpy.arctan2(sy, M[:, i, i])
+        az = numpy.where(regular, numpy.arctan2(M[:, j, i], -M[:, k, i]), 0.0)
+    else:
+        cy = numpy.sqrt(M[:, i, i]*M[:, i, i] + M[:, j, i]*M[:, j, i])
+        regular = cy > _EPS
+        ax = numpy.where(regular, numpy.arctan2(M[:, k, j], M[:, k, k]),
+                         numpy.arctan2(-M[:, j, k], M[:, j, j]))
+        ay = numpy.arctan2(-M[:, k, i], cy)
+        az = numpy.where(regular, numpy.arctan2(M[:, j, i], M[:, i, i]), 0.0)
+
+    if parity:
+        ax, ay, az = -ax, -ay, -az
+    if frame:
+        ax, az = az, ax
+    return numpy.column_stack((ax, ay, az))
+
+
 def euler_from_quaternion(quaternion, axes='sxyz'):
     """Return Euler angles from quaternion for specified axis sequence.
 
@@ -1194,6 +1768,81 @@ def quaternion_matrix(quaternion):
         ), dtype=numpy.float64)
 
 
+def quaternion_matrix_batch(quaternions):
+    """Return stack of homogeneous rotation matrices from quaternions.
+
+    quaternions : array_like of shape (N, 4)
+
+    >>> Q = numpy.array([random_quaternion() for n in range(5)])
+    >>> Q[1] *= 3.0
+    >>> Q[2] = 0.0
+    >>> R = quaternion_matrix_batch(Q)
+    >>> all(numpy.allclose(R[n], quaternion_matrix(Q[n])) for n in range(5))
+    True
+
+    """
+    q = numpy.array(quaternions, dtype=numpy.float64, ndmin=2)[:, :4]
+    nq = numpy.sum(q*q, axis=1)
+    small = nq < _EPS
+    q *= numpy.sqrt(2.0 / numpy.where(small, 1.0, nq))[:, numpy.newaxis]
+    q[small] = 0.0  # identity
+    q = q[:, :, numpy.newaxis] * q[:, numpy.newaxis, :]
+
+    M = numpy.zeros((len(q), 4, 4), dtype=numpy.float64)
+    M[:, 0, 0] = 1.0-q[:, 1, 1]-q[:, 2, 2]
+    M[:, 0, 1] = q[:, 0, 1]-q[:, 2, 3]
+    M[:, 0, 2] = q[:, 0, 2]+q[:, 1, 3]
+    M[:, 1, 0] = q[:, 0, 1]+q[:, 2, 3]
+    M[:, 1, 1] = 1.0-q[:, 0, 0]-q[:, 2, 2]
+    M[:, 1, 2] = q[:, 1, 2]-q[:, 0, 3]
+    M[:, 2, 0] = q[:, 0, 2]-q[:, 1, 3]
+    M[:, 2, 1] = q[:, 1, 2]+q[:, 0, 3]
+    M[:, 2, 2] = 1.0-q[:, 0, 0]-q[:, 1, 1]
+    M[:, 3, 3] = 1.0
+    return M
+
+
+def quaternion_matrix_jacobian(quaternions):
+    """Return derivatives of rotation matrices by the quaternions.
+
+    quaternions : array_like of shape (4,) or (N, 4)
+
+    The quaternions need not be normalized, as in quaternion_matrix.
+    Return array of shape (4, 4, 4), respectively (N, 4, 4, 4), whose last
+    axis indexes the elements of the quaternions.
+
+    >>> Q = numpy.array([random_quaternion() for n in range(5)])
+    >>> Q[1] *= 3.0
+    >>> d = 1e-6 * numpy.identity(4)
+    >>> J = quaternion_matrix_jacobian(Q)
+    >>> all(numpy.allclose(J[..., m], (quaternion_matrix_batch(Q + d[m]) -
+    ...     quaternion_matrix_batch(Q - d[m])) / 2e-6) for m in range(4))
+    True
+    >>> quaternion_matrix_jacobian([0, 0, 0, 1]).shape
+    (4, 4, 4)
+
+    """
+    q = numpy.array(quaternions, dtype=numpy.float64, ndmin=2)[:, :4]
+    nq = numpy.sum(q*q, axis=1)
+    small = nq < _EPS
+    nq[small] = 1.0
+
+    # M = I + 2/nq * L(q q^T), with L linear
+    L = _quaternion_outer_matrix(q[:, :, numpy.newaxis] * q[:, numpy.newaxis, :])
+    J = numpy.zeros((len(q), 4, 4, 4), dtype=numpy.float64)
+    for m in range(4):
+        dP = numpy.zeros((len(q), 4, 4), dtype=numpy.float64)
+        dP[:, m, :] = q
+        dP[:, :, m] += q
+        J[..., m] = (2.0 / nq)[:, numpy.newaxis, numpy.newaxis] * (
+            _quaternion_outer_matrix(dP) -
+            (2.0 * q[:, m] / nq)[:, numpy.newaxis, numpy.newaxis] * L)
+    J[small] = 0.0
+    if numpy.ndim(quaternions) == 1:
+        return J[0]
+    return J
+
+
 def quaternion_from_matrix(matrix):
     """Return quaternion from rotation matrix.
 
@@ -1227,6 +1876,50 @@ def quaternion_from_matrix(matrix):
     return q
 
 
+def quaternion_from_matrix_batch(matrices):
+    """Return quaternions from stack of rotation matrices.
+
+    matrices : array_like of shape (N, 4, 4)
+
+    The case of quaternion_from_matrix used for each matrix is selected
+    without branching: the four candidates are computed for all matrices.
+
+    >>> R = numpy.array([random_rotation_matrix() for n in range(5)])
+    >>> R[1] = rotation_matrix(math.pi, (1, 0, 0))
+    >>> R[2] = rotation_matrix(math.pi, (0, 1, 1))
+    >>> R[3] = rotation_matrix(3.0, (0, 0, 1))
+    >>> q = quaternion_from_matrix_batch(R)
+    >>> all(numpy.allclose(q[n], quaternion_from_matrix(R[n]))
+    ...     for n in range(5))
+    True
+
+    """
+    M = numpy.asarray(matrices, dtype=numpy.float64)
+    number_of_matrices = len(M)
+    m00, m01, m02 = M[:, 0, 0], M[:, 0, 1], M[:, 0, 2]
+    m10, m11, m12 = M[:, 1, 0], M[:, 1, 1], M[:, 1, 2]
+    m20, m21, m22 = M[:, 2, 0], M[:, 2, 1], M[:, 2, 2]
+    m33 = M[:, 3, 3]
+
+    # candidates, one per largest diagonal element (x, y, z) or trace (w)
+    Q = numpy.empty((number_of_matrices, 4, 4), dtype=numpy.float64)
+    Q[:, 0] = numpy.column_stack((m00 - (m11 + m22) + m33, m01 + m10,
+                                  m20 + m02, m21 - m12))
+    Q[:, 1] = numpy.column_stack((m01 + m10, m11 - (m22 + m00) + m33,
+                                  m12 + m21, m02 - m20))
+    Q[:, 2] = numpy.column_stack((m20 + m02, m12 + m21,
+                                  m22 - (m00 + m11) + m33, m10 - m01))
+    Q[:, 3] = numpy.column_stack((m21 - m12, m02 - m20, m10 - m01,
+                                  m00 + m11 + m22 + m33))
+
+    diagonal = numpy.column_stack((m00, m11, m22))
+    case = numpy.where(Q[:, 3, 3] > m33, 3, numpy.argmax(diagonal, axis=1))
+    rows = numpy.arange(number_of_matrices)
+    q = Q[rows, case]
+    q *= (0.5 / numpy.sqrt(q[rows, case] * m33))[:, numpy.newaxis]
+    return q
+
+
 def quaternion_multiply(quaternion1, quaternion0):
     """Return multiplication of two quaternions.
 
@@ -1244,6 +1937,33 @@ def quaternion_multiply(quaternion1, quaternion0):
         -x1*x0 - y1*y0 - z1*z0 + w1*w0), dtype=numpy.float64)
 
 
+def quaternion_multiply_batch(quaternions1, quaternions0):
+    """Return multiplication of two stacks of quaternions, row by row.
+
+    quaternions1, quaternions0 : array_like of shape (N, 4) or (4, )
+
+    >>> q1 = numpy.random.random((5, 4)) - 0.5
+    >>> q0 = numpy.random.random((5, 4)) - 0.5
+    >>> q = quaternion_multiply_batch(q1, q0)
+    >>> all(numpy.allclose(q[n], quaternion_multiply(q1[n], q0[n]))
+    ...     for n in range(5))
+    True
+    >>> q = quaternion_multiply_batch([1, -2, 3, 4], [[-5, 6, 7, 8]])
+    >>> numpy.allclose(q, [[-44, -14, 48, 28]])
+    True
+
+    """
+    q0 = numpy.atleast_2d(numpy.asarray(quaternions0, dtype=numpy.float64))
+    q1 = numpy.atleast_2d(numpy.asarray(quaternions1, dtype=numpy.float64))
+    x0, y0, z0, w0 = q0[:, 0], q0[:, 1], q0[:, 2], q0[:, 3]
+    x1, y1, z1, w1 = q1[:, 0], q1[:, 1], q1[:, 2], q1[:, 3]
+    return numpy.column_stack((
+         x1*w0 + y1*z0 - z1*y0 + w1*x0,
+        -x1*z0 + y1*w0 + z1*x0 + w1*y0,
+         x1*y0 - y1*x0 + z1*w0 + w1*z0,
+        -x1*x0 - y1*y0 - z1*z0 + w1*w0))
+
+
 def quaternion_conjugate(quaternion):
     """Return conjugate of quaternion.
 
@@ -1257,6 +1977,20 @@ def quaternion_conjugate(quaternion):
                         -quaternion[2], quaternion[3]), dtype=numpy.float64)
 
 
+def quaternion_conjugate_batch(quaternions):
+    """Return conjugates of stack of quaternions.
+
+    >>> q0 = numpy.array([random_quaternion() for n in range(5)])
+    >>> q1 = quaternion_conjugate_batch(q0)
+    >>> all(numpy.allclose(q1[n], quaternion_conjugate(q0[n]))
+    ...     for n in range(5))
+    True
+
+    """
+    return numpy.array(quaternions, dtype=numpy.float64, ndmin=2) * \
+        numpy.array((-1.0, -1.0, -1.0, 1.0))
+
+
 def quaternion_inverse(quaternion):
     """Return inverse of quaternion.
 
@@ -1310,6 +2044,56 @@ def quaternion_slerp(quat0, quat1, fraction, spin=0, shortestpath=True):
     return q0
 
 
+def quaternion_slerp_batch(quats0, quats1, fractions, spin=0,
+                           shortestpath=True):
+    """Return spherical linear interpolations between stacks of quaternions.
+
+    quats0, quats1 : array_like of shape (N, 4)
+    fractions : scalar or array_like of shape (N, )
+
+    The special cases of quaternion_slerp are selected row by row.
+
+    >>> q0 = numpy.array([random_quaternion() for n in range(6)])
+    >>> q1 = numpy.array([random_quaternion() for n in range(6)])
+    >>> q1[4] = q0[4]
+    >>> q1[5] = -q0[5]
+    >>> f = numpy.array([0.0, 1.0, 0.5, 0.3, 0.7, 0.2])
+    >>> q = quaternion_slerp_batch(q0, q1, f)
+    >>> all(numpy.allclose(q[n], quaternion_slerp(q0[n], q1[n], f[n]))
+    ...     for n in range(6))
+    True
+    >>> q = quaternion_slerp_batch(q0, q1, 0.25, spin=1, shortestpath=False)
+    >>> all(numpy.allclose(q[n], quaternion_slerp(q0[n], q1[n], 0.25, 1,
+    ...     False)) for n in range(4))
+    True
+
+    """
+    q0 = unit_vector(numpy.array(quats0, dtype=numpy.float64,
+                                 ndmin=2)[:, :4], axis=1)
+    q1 = unit_vector(numpy.array(quats1, dtype=numpy.float64,
+                                 ndmin=2)[:, :4], axis=1)
+    fractions = numpy.zeros((len(q0), ), dtype=numpy.float64) + fractions
+
+    d = numpy.sum(q0 * q1, axis=1)
+    degenerate = numpy.abs(numpy.abs(d) - 1.0) < _EPS
+    if shortestpath:
+        # invert rotation
+        flip = d < 0.0
+        d = numpy.where(flip, -d, d)
+        q1_path = numpy.where(flip[:, numpy.newaxis], -q1, q1)
+    else:
+        q1_path = q1
+    angle = numpy.arccos(numpy.clip(d, -1.0, 1.0)) + spin * math.pi
+    degenerate |= numpy.abs(angle) < _EPS
+    isin = 1.0 / numpy.where(degenerate, 1.0, numpy.sin(angle))
+
+    q = q0 * (numpy.sin((1.0 - fractions) * angle) * isin)[:, numpy.newaxis]
+    q += q1_path * (numpy.sin(fractions * angle) * isin)[:, numpy.newaxis]
+    q = numpy.where(degenerate[:, numpy.newaxis], q0, q)
+    q = numpy.where((fractions == 1.0)[:, numpy.newaxis], q1, q)
+    return numpy.where((fractions == 0.0)[:, numpy.newaxis], q0, q)
+
+
 def random_quaternion(rand=None):
     """Return uniform random unit quaternion.
 
@@ -1534,6 +2318,28 @@ _TUPLE2AXES = dict((v, k) for k, v in _AXES2TUPLE.items())
 
 # helper functions
 
+def _points_dtype(points):
+    """Return dtype of transformed points, float32 for float32 points."""
+    if points.dtype == numpy.float32:
+        return numpy.float32
+    return numpy.float64
+
+
+def _quaternion_outer_matrix(q):
+    """Return 4x4 matrices L(q q^T) with quaternion_matrix = I + 2/|q|^2 L."""
+    M = numpy.zeros((len(q), 4, 4), dtype=numpy.float64)
+    M[:, 0, 0] = -q[:, 1, 1]-q[:, 2, 2]
+    M[:, 0, 1] = q[:, 0, 1]-q[:, 2, 3]
+    M[:, 0, 2] = q[:, 0, 2]+q[:, 1, 3]
+    M[:, 1, 0] = q[:, 0, 1]+q[:, 2, 3]
+    M[:, 1, 1] = -q[:, 0, 0]-q[:, 2, 2]
+    M[:, 1, 2] = q[:, 1, 2]-q[:, 0, 3]
+    M[:, 2, 0] = q[:, 0, 2]-q[:, 1, 3]
+    M[:, 2, 1] = q[:, 1, 2]+q[:, 0, 3]
+    M[:, 2, 2] = -q[:, 0, 0]-q[:, 1, 1]
+    return M
+
+
 def vector_norm(data, axis=None, out=None):
     """Return length, i.e. eucledian norm, of ndarray along axis.
 
@@ -1649,12 +2455,42 @@ def inverse_matrix(matrix):
 
 
 def inverse_transformation_matrix_fast(matrix):
-    ident1 = numpy.identity(4)
-    ident2 = numpy.identity(4)
+    """Return inverse of rigid transformation matrix.
 
-    ident1[:3, :3] = matrix[:3, :3].copy()
-    ident2[:3, -1] = -matrix[:3, -1].copy()
-    return numpy.dot(ident1.T, ident2)
+    Uses the transposed rotation instead of a general matrix inverse.
+
+    >>> M = random_rotation_matrix()
+    >>> M[:3, 3] = numpy.random.random(3)
+    >>> numpy.allclose(inverse_transformation_matrix_fast(M),
+    ...                inverse_matrix(M))
+    True
+
+    """
+    M = numpy.identity(4)
+    M[:3, :3] = matrix[:3, :3].T
+    M[:3, 3] = -numpy.dot(M[:3, :3], matrix[:3, 3])
+    return M
+
+
+def inverse_transformation_matrix_batch(matrices):
+    """Return stack of inverses of rigid transformation matrices.
+
+    matrices : array_like of shape (N, 4, 4)
+
+    >>> M = numpy.array([random_rotation_matrix() for n in range(5)])
+    >>> M[:, :3, 3] = numpy.random.random((5, 3))
+    >>> Mi = inverse_transformation_matrix_batch(M)
+    >>> all(numpy.allclose(Mi[n], inverse_matrix(M[n])) for n in range(5))
+    True
+
+    """
+    matrices = numpy.asarray(matrices, dtype=numpy.float64)
+    M = numpy.zeros(matrices.shape, dtype=numpy.float64)
+    M[..., :3, :3] = numpy.swapaxes(matrices[..., :3, :3], -1, -2)
+    M[..., :3, 3] = -numpy.einsum('...ij,...j->...i', M[..., :3, :3],
+                                  matrices[..., :3, 3])
+    M[..., 3, 3] = 1.0
+    return M
 
 
 def concatenate_matrices(*matrices):
@@ -1673,6 +2509,124 @@ def concatenate_matrices(*matrices):
     return M
 
 
+def concatenate_matrices_batch(*matrices):
+    """Return stack of concatenations of stacks of transformation matrices.
+
+    Each argument is an array_like of shape (N, 4, 4), or (4, 4) to use the
+    same matrix for the whole stack.
+
+    >>> M0 = numpy.random.rand(5, 4, 4) - 0.5
+    >>> M1 = numpy.random.rand(4, 4) - 0.5
+    >>> M2 = numpy.random.rand(5, 4, 4) - 0.5
+    >>> M = concatenate_matrices_batch(M0, M1, M2)
+    >>> all(numpy.allclose(M[n], concatenate_matrices(M0[n], M1, M2[n]))
+    ...     for n in range(5))
+    True
+
+    """
+    M = numpy.identity(4)
+    for i in matrices:
+        M = numpy.matmul(M, numpy.asarray(i, dtype=numpy.float64))
+    return M
+
+
+def concatenate_matrices_cumulative(matrices):
+    """Return cumulative concatenations along a chain of matrices.
+
+    matrices : array_like of shape (L, 4, 4), e.g. the transformations
+        between consecutive links of a kinematic chain, or (N, L, 4, 4) for
+        a stack of N chains
+
+    Element i of the result is the concatenation of matrices 0 to i, i.e.
+    the transformation from link i to the base of the chain.
+
+    >>> M = numpy.random.rand(3, 6, 4, 4) - 0.5
+    >>> C = concatenate_matrices_cumulative(M)
+    >>> numpy.allclose(C[1, 3], concatenate_matrices(*M[1, :4]))
+    True
+    >>> numpy.allclose(concatenate_matrices_cumulative(M[1])[5],
+    ...                concatenate_matrices(*M[1]))
+    True
+
+    """
+    M = numpy.array(matrices, dtype=numpy.float64)
+    for i in range(1, M.shape[-3]):
+        numpy.matmul(M[..., i-1, :, :], M[..., i, :, :].copy(),
+                     out=M[..., i, :, :])
+    return M
+
+
+def transform_points(matrix, points, out=None):
+    """Return points transformed by homogeneous matrix.
+
+    matrix : array_like of shape (4, 4). The last row is not used, i.e. the
+        matrix is affine.
+    points : array_like of shape (N, 3)
+    out : optional array of shape (N, 3), float32 or float64, to store the
+        result. It may be points itself.
+
+    The points are not padded to homogeneous coordinates. If out is None,
+    float32 points give float32 results and others float64 results.
+
+    >>> M = random_rotation_matrix()
+    >>> M[:3, 3] = numpy.random.random(3)
+    >>> v = numpy.random.random((10, 3))
+    >>> v1 = transform_points(M, v)
+    >>> h = numpy.vstack((v.T, numpy.ones(10)))
+    >>> numpy.allclose(v1, numpy.dot(M, h)[:3].T)
+    True
+    >>> v32 = v.astype(numpy.float32)
+    >>> transform_points(M, v32, out=v32) is v32
+    True
+    >>> numpy.allclose(v32, v1, atol=1e-6)
+    True
+
+    """
+    M = numpy.asarray(matrix)
+    points = numpy.asarray(points)
+    if out is None:
+        out = numpy.empty(points.shape, dtype=_points_dtype(points))
+    # contiguous rotation, matmul is much slower with a transposed view
+    R = numpy.ascontiguousarray(M[:3, :3].T, dtype=out.dtype)
+    numpy.matmul(points, R, out=out)
+    out += M[:3, 3].astype(out.dtype)
+    return out
+
+
+def transform_points_batch(matrices, points, out=None):
+    """Return points transformed by each matrix of stack of matrices.
+
+    matrices : array_like of shape (K, 4, 4)
+    points : array_like of shape (K, N, 3), or (N, 3) to transform the same
+        points by every matrix
+    out : optional array of shape (K, N, 3), float32 or float64, to store
+        the result. It may be points itself.
+
+    >>> M = numpy.array([random_rotation_matrix() for k in range(5)])
+    >>> M[:, :3, 3] = numpy.random.random((5, 3))
+    >>> v = numpy.random.random((5, 10, 3))
+    >>> v1 = transform_points_batch(M, v)
+    >>> all(numpy.allclose(v1[k], transform_points(M[k], v[k]))
+    ...     for k in range(5))
+    True
+    >>> out = numpy.empty((5, 10, 3), dtype=numpy.float32)
+    >>> v1 = transform_points_batch(M, v[0], out=out)
+    >>> numpy.allclose(v1[3], transform_points(M[3], v[0]), atol=1e-6)
+    True
+
+    """
+    M = numpy.asarray(matrices)
+    points = numpy.asarray(points)
+    if out is None:
+        out = numpy.empty((len(M),) + points.shape[-2:],
+                          dtype=_points_dtype(points))
+    R = numpy.ascontiguousarray(numpy.swapaxes(M[:, :3, :3], 1, 2),
+                                dtype=out.dtype)
+    numpy.matmul(points, R, out=out)
+    out += M[:, numpy.newaxis, :3, 3].astype(out.dtype)
+    return out
+
+
 def is_same_transform(matrix0, matrix1):
     """Return True if two matrices perform same transformation.
 
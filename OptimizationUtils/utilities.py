@@ -8,9 +8,9 @@ A set of utilities to be used in the optimization algorithms
 # -------------------------------------------------------------------------------
 from copy import deepcopy
 
-from . import transformations
+from . import lie_groups, transformations
 
-import KeyPressManager
+from . import KeyPressManager
 import numpy as np
 import cv2
 from matplotlib import cm
@@ -339,15 +339,67 @@ def drawAxis3DOrigin(ax, transform, text, line_width=1.0, fontsize=12, handles=N
 # ---------------------------------------
 
 def matrixToRodrigues(T):
-    rods, _ = cv2.Rodrigues(T[0:3, 0:3])
-    rods = rods.transpose()
-    return rods[0]
+    return matrixToRodriguesBatch(np.array(T, dtype=float, ndmin=3))[0]
 
 
 def rodriguesToMatrix(r):
-    rod = np.array(r, dtype=np.float)
-    matrix = cv2.Rodrigues(rod)
-    return matrix[0]
+    return rodriguesToMatrixBatch(np.reshape(np.array(r, dtype=float), (1, 3)))[0]
+
+
+def _derivativeSeries(series):
+    """ Given the Taylor series in t^2 of a function f(t), returns the one of f'(t) / t. """
+    return [2 * k * coefficient for k, coefficient in enumerate(series)][1:]
+
+
+# Derivatives, divided by the angle, of the coefficients of the Rodrigues formula. Same format as the coefficients in
+# lie_groups: a pair of the Taylor series in t^2, used below lie_groups._THRESHOLD, and the closed form.
+_SIN_OVER_THETA_DERIVATIVE = (_derivativeSeries(lie_groups._SIN_OVER_THETA[0]),
+                              lambda t, s, c: (t * c - s) / t ** 3)
+_ONE_MINUS_COS_OVER_THETA2_DERIVATIVE = (_derivativeSeries(lie_groups._ONE_MINUS_COS_OVER_THETA2[0]),
+                                         lambda t, s, c: (t * s - 2.0 * (1.0 - c)) / t ** 4)
+_SKEW_INDICES = [(2, 1), (0, 2), (1, 0)]  # element of the skew symmetric matrix which is +r[c]
+
+
+def rodriguesToMatrixBatch(r, jacobian=False):
+    """ Converts rotation vectors to rotation matrices, R = I + sin(t)/t K + (1 - cos(t))/t^2 K^2 with t = |r| and K the
+    skew symmetric matrix of r (see lie_groups.so3_exp). Small angles use the Taylor series of the coefficients.
+
+    :param r: (N,3) array of rotation vectors.
+    :param jacobian: if True also returns the derivatives of the matrices.
+    :return: (N,3,3) array of rotation matrices and, if jacobian is True, a (N,9,3) array with the derivatives of the
+    matrix elements (row major) in order to the three elements of r.
+    """
+    r = np.array(r, dtype=float, ndmin=2)
+    R = lie_groups.so3_exp(r)
+    if not jacobian:
+        return R
+
+    # R = I + a K + b K^2, and the derivatives of a and b in order to r are da * r and db * r
+    a, b, da, db = lie_groups._coefficients(np.sum(r * r, axis=1), lie_groups._SIN_OVER_THETA,
+                                            lie_groups._ONE_MINUS_COS_OVER_THETA2, _SIN_OVER_THETA_DERIVATIVE,
+                                            _ONE_MINUS_COS_OVER_THETA2_DERIVATIVE)
+    K = lie_groups.hat(r)
+    K2 = np.matmul(K, K)
+
+    J = np.empty((len(r), 9, 3), dtype=float)
+    for c in range(3):
+        Kc = np.zeros((3, 3), dtype=float)  # derivative of K in order to r[c]
+        Kc[_SKEW_INDICES[c]] = 1.0
+        Kc -= Kc.T
+        dR = (da * r[:, c])[:, None, None] * K + a[:, None, None] * Kc + (db * r[:, c])[:, None, None] * K2 + \
+            b[:, None, None] * (np.matmul(Kc, K) + np.matmul(K, Kc))
+        J[:, :, c] = dR.reshape((-1, 9))
+    return R, J
+
+
+def matrixToRodriguesBatch(R):
+    """ Converts rotation matrices to rotation vectors. Uses atan2 for the angle, the Taylor series for small angles
+    and the symmetric part of the matrix for angles close to pi.
+
+    :param R: (N,3,3) or (N,4,4) array of rotation or transformation matrices.
+    :return: (N,3) array of rotation vectors.
+    """
+    return lie_groups.so3_log(R)
 
 
 def traslationRodriguesToTransform(translation, rodrigues):
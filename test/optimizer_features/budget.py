@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+This example shows how to limit an optimization with setBudget. When the budget is used the solver stops cleanly, with
+status OptimizationUtils.BUDGET_EXHAUSTED, and the best params seen in any evaluation are written to the data models.
+"""
+
+# -------------------------------------------------------------------------------
+# --- IMPORTS (standard, then third party, then my own modules)
+# -------------------------------------------------------------------------------
+import numpy as np
+
+import OptimizationUtils.OptimizationUtils as OptimizationUtils
+from synthetic_problems import buildPoseProblem
+
+# -------------------------------------------------------------------------------
+# --- MAIN
+# -------------------------------------------------------------------------------
+if __name__ == "__main__":
+
+    # ---------------------------------------
+    # --- Without budget
+    # ---------------------------------------
+    opt, true_pose = buildPoseProblem()
+    opt.startOptimization()
+    print('Without budget: ' + str(opt.result.nfev) + ' evaluations, final cost ' + str(opt.result.cost))
+
+    # ---------------------------------------
+    # --- Budget of evaluations
+    # ---------------------------------------
+    # evaluations include the ones used to compute the jacobian, i.e. 6 more per iteration for a pose group
+    opt, true_pose = buildPoseProblem()
+    opt.setBudget(evaluations=40)
+    opt.startOptimization()
+    print('With a budget of 40 evaluations: status ' + str(opt.result.status) + ', ' + str(opt.result.message))
+    print('Best cost ' + str(opt.best_cost) + ', initial cost ' + str(0.5 * np.sum(opt.errors0 ** 2)))
+    assert opt.result.status == OptimizationUtils.BUDGET_EXHAUSTED
+    assert np.array_equal(opt.xf, opt.best_x)  # the best x evaluated is written to xf and to the data models
+
+    # ---------------------------------------
+    # --- Budget of time
+    # ---------------------------------------
+    # the budget is checked at each evaluation, so the optimization may run slightly longer
+    opt, true_pose = buildPoseProblem(number_of_points=20000)
+    opt.setBudget(seconds=0.5)
+    opt.startOptimization()
+    print('With a budget of 0.5 seconds: status ' + str(opt.result.status) + ', best cost ' + str(opt.best_cost))
+    print('Pose error: ' + str(np.abs(opt.data_models['scene'].pose - true_pose).max()))
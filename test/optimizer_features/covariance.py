@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""
+This example shows how to compute the covariance of the estimated params with computeCovariance. For the polynomial
+fit, which is linear in the coefficients, the covariance is compared to the closed form noise^2 * (A^T A)^-1.
+"""
+
+# -------------------------------------------------------------------------------
+# --- IMPORTS (standard, then third party, then my own modules)
+# -------------------------------------------------------------------------------
+import numpy as np
+
+from synthetic_problems import buildPolynomialProblem, buildPoseProblem
+
+# -------------------------------------------------------------------------------
+# --- MAIN
+# -------------------------------------------------------------------------------
+if __name__ == "__main__":
+    np.set_printoptions(precision=4, suppress=False)
+    noise = 0.05
+
+    # ---------------------------------------
+    # --- Polynomial fit
+    # ---------------------------------------
+    opt = buildPolynomialProblem(noise=noise)
+    opt.startOptimization(optimization_options={'x_scale': 'jac', 'ftol': 1e-10, 'xtol': 1e-10, 'gtol': 1e-10})
+
+    # with the known variance of the residuals the covariance does not depend on the noise of this sample
+    covariance = opt.computeCovariance(groups=['c'], residual_variance=noise ** 2)['c']
+
+    polynomial = opt.data_models['polynomial']
+    A = np.vander(polynomial.xs, len(polynomial.coefficients), increasing=True)  # d residual / d coefficient
+    expected = noise ** 2 * np.linalg.inv(np.dot(A.T, A))
+    print('Covariance of the coefficients:\n' + str(covariance))
+    print('Closed form:\n' + str(expected))
+    assert np.allclose(covariance, expected, rtol=1e-4)
+
+    # the variance of the residuals estimated from the final cost is close to the one of the noise
+    estimated = opt.computeCovariance(groups=['c'])['c']
+    print('Standard deviations with the estimated residual variance: ' + str(np.sqrt(np.diag(estimated))))
+    print('Standard deviations with the known residual variance:     ' + str(np.sqrt(np.diag(covariance))))
+
+    # ---------------------------------------
+    # --- Pose estimation
+    # ---------------------------------------
+    # for pose groups the covariance is the one of the translation and of the local update of the rotation
+    opt, true_pose = buildPoseProblem(noise=0.01)
+    opt.startOptimization()
+    covariance = opt.computeCovariance()['pose']
+    print('Standard deviations of the pose params (tx, ty, tz, rx, ry, rz): ' + str(np.sqrt(np.diag(covariance))))
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+"""
+This example shows how to export the layout and the results of a problem with exportProblem, and how to import them
+with importProblem, e.g. to compare results without the original data. The file is written with numpy (.npz) or, if
+h5py is installed and the name ends with .h5, in HDF5.
+"""
+
+# -------------------------------------------------------------------------------
+# --- IMPORTS (standard, then third party, then my own modules)
+# -------------------------------------------------------------------------------
+import os
+import tempfile
+
+import numpy as np
+
+import OptimizationUtils.OptimizationUtils as OptimizationUtils
+from synthetic_problems import buildPoseProblem
+
+# -------------------------------------------------------------------------------
+# --- MAIN
+# -------------------------------------------------------------------------------
+if __name__ == "__main__":
+    directory = tempfile.mkdtemp()
+
+    opt, true_pose = buildPoseProblem()
+    opt.startOptimization()
+
+    extensions = ['.npz']
+    if OptimizationUtils.h5py is not None:
+        extensions.append('.h5')
+
+    for extension in extensions:
+        filename = os.path.join(directory, 'problem' + extension)
+        opt.exportProblem(filename)
+
+        imported = OptimizationUtils.Optimizer()
+        imported.importProblem(filename)
+        print('Imported ' + filename + ': ' + str(imported.getNumberOfParameters()) + ' params, ' +
+              str(imported.getNumberOfResiduals()) + ' residuals, residual blocks ' +
+              str(list(imported.residual_blocks.keys())))
+
+        # the rotation params are exported as the rotation vector of the rotation, not as the local update
+        print('Exported xf: ' + str(imported.xf))
+        assert np.allclose(imported.errorsf, opt.errorsf)
+        assert (imported.sparse_matrix != opt.sparse_matrix).nnz == 0
+        os.remove(filename)
+
+    os.rmdir(directory)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+"""
+This example shows the mini-batch solver selected with setSolver('minibatch'). Each step is computed on a random
+fraction of the samples of the polynomial fit, and the cost of all samples is checked every check_every steps.
+"""
+
+# -------------------------------------------------------------------------------
+# --- IMPORTS (standard, then third party, then my own modules)
+# -------------------------------------------------------------------------------
+import numpy as np
+
+from synthetic_problems import buildPolynomialProblem
+
+# -------------------------------------------------------------------------------
+# --- MAIN
+# -------------------------------------------------------------------------------
+if __name__ == "__main__":
+
+    # ---------------------------------------
+    # --- Full problem solved with trf
+    # ---------------------------------------
+    opt = buildPolynomialProblem(number_of_samples=100000)
+    opt.startOptimization()
+    xf = opt.xf
+
+    # ---------------------------------------
+    # --- Mini-batches
+    # ---------------------------------------
+    opt = buildPolynomialProblem(number_of_samples=100000)
+
+    # as with subsampling, the objective function may compute only the residuals of the mini-batch
+    def objectiveFunction(models):
+        polynomial = models['polynomial']
+        subset = opt.getResidualBlockSubset('r_{}')
+        return {'r_{}': polynomial.evaluate(polynomial.xs[subset]) - polynomial.ys[subset]}
+
+    opt.setObjectiveFunction(objectiveFunction)
+    opt.setSolver('minibatch', batch_fraction=0.01, iterations=200, check_every=10, seed=0)
+    opt.startOptimization(optimization_options={'ftol': 1e-6})
+    print('Status ' + str(opt.result.status) + ': ' + str(opt.result.message))
+
+    # each step sees only 1000 samples, so the result is close to, but not the same as, the full least squares fit
+    print('Coefficients with trf:          ' + str(xf))
+    print('Coefficients with mini-batches: ' + str(opt.xf))
+    assert np.allclose(opt.xf, xf, atol=0.01)
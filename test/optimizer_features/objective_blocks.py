@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+"""
+This example shows objective blocks evaluated by a thread pool. The pose problem has one objective block per point
+cloud (see buildPoseProblem), which run concurrently after setNumberOfThreads. The blocks only read the data models.
+"""
+
+# -------------------------------------------------------------------------------
+# --- IMPORTS (standard, then third party, then my own modules)
+# -------------------------------------------------------------------------------
+import time
+
+import numpy as np
+
+from synthetic_problems import buildPoseProblem
+
+# -------------------------------------------------------------------------------
+# --- MAIN
+# -------------------------------------------------------------------------------
+if __name__ == "__main__":
+
+    xfs = []
+    for number_of_threads in [1, 4]:
+        opt, true_pose = buildPoseProblem(number_of_clouds=4, number_of_points=20000)
+        opt.setNumberOfThreads(number_of_threads)
+        start = time.time()
+        opt.startOptimization()
+        print(str(number_of_threads) + ' threads: ' + str(time.time() - start) + ' seconds, pose error ' +
+              str(np.abs(opt.data_models['scene'].pose - true_pose).max()))
+        xfs.append(opt.xf)
+
+    # the blocks are evaluated in the same way, only concurrently. The speed up depends on the number of cpus
+    assert np.allclose(xfs[0], xfs[1])
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""
+This example shows the OptimizationResult of an optimization: the scipy result and a recording of the accepted
+iterations. The recording is used by replayOptimization to show the optimization after it ends, instead of calling the
+visualization function during the optimization.
+"""
+
+# -------------------------------------------------------------------------------
+# --- IMPORTS (standard, then third party, then my own modules)
+# -------------------------------------------------------------------------------
+import matplotlib.pyplot as plt
+import numpy as np
+
+from synthetic_problems import buildPolynomialProblem
+
+# -------------------------------------------------------------------------------
+# --- MAIN
+# -------------------------------------------------------------------------------
+if __name__ == "__main__":
+    opt = buildPolynomialProblem(number_of_samples=200, noise=0.2)
+    polynomial = opt.data_models['polynomial']
+
+    # ---------------------------------------
+    # --- Define THE VISUALIZATION FUNCTION
+    # ---------------------------------------
+    fig = plt.figure()
+    ax = fig.gca()
+    ax.plot(polynomial.xs, polynomial.ys, 'k.', label='samples')
+    handle_plot = ax.plot(polynomial.xs, polynomial.evaluate(polynomial.xs), 'r-', label='polynomial')
+    ax.legend(loc='upper right')
+
+    def visualizationFunction(models):
+        polynomial = models['polynomial']
+        handle_plot[0].set_ydata(polynomial.evaluate(polynomial.xs))
+
+    opt.setVisualizationFunction(visualizationFunction, False, figures=fig)  # not called during the optimization
+
+    # ---------------------------------------
+    # --- Start Optimization
+    # ---------------------------------------
+    opt.startOptimization()
+
+    # the result gives access to the scipy result and to the recording
+    result = opt.result
+    print('Scipy result: status ' + str(result.status) + ', cost ' + str(result.cost) + ', ' + str(result['message']))
+    print('Recorded ' + str(len(result)) + ' iterations')
+    print('Costs: ' + str(result.costs))
+    print('Seconds since the start: ' + str(result.times))
+    trajectory = result.getTrajectory()
+    print('Params in the first and last iterations:\n' + str(trajectory[[0, -1]]))
+    assert np.allclose(trajectory[-1], opt.xf, atol=1e-5)  # the recording keeps the params in float32
+
+    # ---------------------------------------
+    # --- Replay
+    # ---------------------------------------
+    opt.replayOptimization(time_to_wait=0.5)
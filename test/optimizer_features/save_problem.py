@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+This example shows how to save a configured problem with saveProblem and load it with loadProblem, e.g. to optimize
+it again later or in another process. Functions are saved by module and name, so they must be defined at module level,
+as the ones of synthetic_problems.py.
+"""
+
+# -------------------------------------------------------------------------------
+# --- IMPORTS (standard, then third party, then my own modules)
+# -------------------------------------------------------------------------------
+import os
+import tempfile
+
+import numpy as np
+
+import OptimizationUtils.OptimizationUtils as OptimizationUtils
+from synthetic_problems import buildPoseProblem
+
+# -------------------------------------------------------------------------------
+# --- MAIN
+# -------------------------------------------------------------------------------
+if __name__ == "__main__":
+    filename = os.path.join(tempfile.mkdtemp(), 'problem.pkl')
+
+    # ---------------------------------------
+    # --- Save
+    # ---------------------------------------
+    opt, true_pose = buildPoseProblem()
+    opt.saveProblem(filename)  # before the optimization, so x is still the initial guess
+    opt.startOptimization()
+
+    # ---------------------------------------
+    # --- Load and optimize again
+    # ---------------------------------------
+    loaded = OptimizationUtils.Optimizer()
+    loaded.loadProblem(filename)
+    loaded.printParameters()
+    loaded.startOptimization()
+    print('Pose estimated by the original problem:\n' + str(opt.data_models['scene'].pose))
+    print('Pose estimated by the loaded problem:\n' + str(loaded.data_models['scene'].pose))
+    assert np.allclose(loaded.xf, opt.xf)
+
+    # functions which cannot be found by module and name are reported when saving
+    opt.setObjectiveFunction(lambda models: [])
+    try:
+        opt.saveProblem(filename)
+    except ValueError as error:
+        print('Cannot save: ' + str(error))
+
+    os.remove(filename)
+    os.rmdir(os.path.dirname(filename))
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""
+This example shows a coarse to fine optimization with setSubsamplingSchedule. The first stages use only some of the
+samples of the polynomial fit, and the objective function computes only the residuals given by getResidualBlockSubset.
+"""
+
+# -------------------------------------------------------------------------------
+# --- IMPORTS (standard, then third party, then my own modules)
+# -------------------------------------------------------------------------------
+import numpy as np
+
+from synthetic_problems import buildPolynomialProblem
+
+# -------------------------------------------------------------------------------
+# --- MAIN
+# -------------------------------------------------------------------------------
+if __name__ == "__main__":
+
+    # ---------------------------------------
+    # --- Without subsampling
+    # ---------------------------------------
+    opt = buildPolynomialProblem(number_of_samples=100000)
+    opt.startOptimization()
+    xf = opt.xf
+
+    # ---------------------------------------
+    # --- Coarse to fine
+    # ---------------------------------------
+    opt = buildPolynomialProblem(number_of_samples=100000)
+
+    # the objective function may compute all residuals, but computing only the active ones is what saves time
+    evaluations = {}  # dict: key={number of computed residuals} value = number of evaluations
+
+    def objectiveFunction(models):
+        polynomial = models['polynomial']
+        subset = opt.getResidualBlockSubset('r_{}')
+        evaluations[len(subset)] = evaluations.get(len(subset), 0) + 1
+        return {'r_{}': polynomial.evaluate(polynomial.xs[subset]) - polynomial.ys[subset]}
+
+    opt.setObjectiveFunction(objectiveFunction)
+    opt.setSubsamplingSchedule([100, 10], mode='random', seed=0)  # a last stage with all residuals is added
+    opt.startOptimization()
+
+    for number_of_residuals in sorted(evaluations):
+        print(str(evaluations[number_of_residuals]) + ' evaluations with ' + str(number_of_residuals) + ' residuals')
+
+    # the last stage uses all residuals, so the result is the same
+    print('Coefficients without subsampling: ' + str(xf))
+    print('Coefficients with subsampling:    ' + str(opt.xf))
+    assert np.allclose(opt.xf, xf, atol=1e-6)
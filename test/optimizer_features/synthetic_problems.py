@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Small synthetic problems used by the examples in this directory: fitting a polynomial to noisy samples and estimating
+the pose of a set of point clouds. Getters, setters and objective functions are defined at module level, so that the
+problems can be pickled (see save_problem.py) and sent to worker processes (see worker_pool.py).
+"""
+
+# -------------------------------------------------------------------------------
+# --- IMPORTS (standard, then third party, then my own modules)
+# -------------------------------------------------------------------------------
+from functools import partial
+
+import numpy as np
+
+import OptimizationUtils.OptimizationUtils as OptimizationUtils
+import OptimizationUtils.transformations as tf
+
+
+# -------------------------------------------------------------------------------
+# --- CLASSES
+# -------------------------------------------------------------------------------
+class Polynomial(object):
+
+    def __init__(self, xs, ys, degree):
+        self.xs = xs  # the samples
+        self.ys = ys
+        self.coefficients = [0.0] * (degree + 1)  # c0 + c1 * x + c2 * x^2 + ...
+
+    def evaluate(self, xs):
+        return np.polyval(self.coefficients[::-1], xs)
+
+
+class Scene(object):
+
+    def __init__(self, clouds, observed_clouds):
+        self.clouds = clouds  # list of 3xN arrays, the points in the frame of the object
+        self.observed_clouds = observed_clouds  # list of 3xN arrays, the points observed in the world frame
+        self.pose = np.identity(4)  # T(world<-object)
+
+
+# -------------------------------------------------------------------------------
+# --- FUNCTIONS
+# -------------------------------------------------------------------------------
+def getterCoefficients(polynomial):
+    return list(polynomial.coefficients)
+
+
+def setterCoefficients(polynomial, values):
+    polynomial.coefficients = list(values)
+
+
+def polynomialObjectiveFunction(models):
+    polynomial = models['polynomial']
+    return {'r_{}': polynomial.evaluate(polynomial.xs) - polynomial.ys}
+
+
+def buildPolynomialProblem(true_coefficients=(1.0, 2.0, -3.0, 0.5), number_of_samples=500, noise=0.05, seed=0):
+    """ Returns an Optimizer which fits a polynomial to samples of true_coefficients with gaussian noise. The residuals
+    are a single residual block r_{} with one residual per sample.
+    """
+    random = np.random.RandomState(seed)
+    xs = np.linspace(-1, 1, number_of_samples)
+    ys = np.polyval(list(true_coefficients)[::-1], xs) + random.normal(0.0, noise, number_of_samples)
+
+    opt = OptimizationUtils.Optimizer()
+    opt.addDataModel('polynomial', Polynomial(xs, ys, len(true_coefficients) - 1))
+    opt.pushParamVector(group_name='c', data_key='polynomial', getter=getterCoefficients, setter=setterCoefficients)
+    opt.pushResidualBlock(name_template='r_{}', number_of_residuals=number_of_samples,
+                          params=opt.getParamsWithPrefix('c'))
+    opt.setObjectiveFunction(polynomialObjectiveFunction)
+    opt.computeSparseMatrix()
+    opt.setVisualizationFunction(None, False)
+    return opt
+
+
+def getterPose(scene):
+    return scene.pose
+
+
+def setterPose(scene, matrix):
+    scene.pose = matrix
+
+
+def cloudResiduals(models, i):
+    """ Distances, per coordinate, between the points of cloud i moved by the pose and the observed points. """
+    scene = models['scene']
+    moved = np.dot(scene.pose[0:3, 0:3], scene.clouds[i]) + scene.pose[0:3, 3:4]
+    return (moved - scene.observed_clouds[i]).ravel()
+
+
+def buildPoseProblem(number_of_clouds=2, number_of_points=200, noise=0.01, seed=0):
+    """ Returns an Optimizer, and the true pose, which estimates the pose of an object from clouds of its points
+    observed in the world frame with gaussian noise. Each cloud has a residual block cloud<i>_{} computed by its own
+    objective block.
+    """
+    random = np.random.RandomState(seed)
+    true_pose = tf.compose_matrix(angles=(0.3, -0.2, 1.0), translate=(0.5, -1.0, 2.0))
+    clouds, observed_clouds = [], []
+    for i in range(number_of_clouds):
+        cloud = random.uniform(-1, 1, (3, number_of_points))
+        clouds.append(cloud)
+        observed_clouds.append(np.dot(true_pose[0:3, 0:3], cloud) + true_pose[0:3, 3:4] +
+                               random.normal(0.0, noise, (3, number_of_points)))
+
+    opt = OptimizationUtils.Optimizer()
+    opt.addDataModel('scene', Scene(clouds, observed_clouds))
+    opt.pushParamPose(group_name='pose', data_key='scene', getter=getterPose, setter=setterPose,
+                      suffix=['_tx', '_ty', '_tz', '_rx', '_ry', '_rz'])
+    for i in range(number_of_clouds):
+        name_template = 'cloud' + str(i) + '_{}'
+        opt.pushResidualBlock(name_template=name_template, number_of_residuals=3 * number_of_points,
+                              params=opt.getParamsWithPrefix('pose'))
+        opt.pushObjectiveBlock(partial(cloudResiduals, i=i), [name_template])
+    opt.computeSparseMatrix()
+    opt.setVisualizationFunction(None, False)
+    return opt, true_pose
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+This example shows the worker pool of the Optimizer. The workers receive the problem once, when the pool is started,
+and then compute the perturbed points of the jacobian in parallel or evaluate several parameter vectors with
+evaluateInParallel. The samples are put in shared memory with shareArray, so that the workers do not copy them.
+"""
+
+# -------------------------------------------------------------------------------
+# --- IMPORTS (standard, then third party, then my own modules)
+# -------------------------------------------------------------------------------
+import numpy as np
+
+from synthetic_problems import buildPolynomialProblem
+
+# -------------------------------------------------------------------------------
+# --- MAIN
+# -------------------------------------------------------------------------------
+if __name__ == "__main__":
+
+    # ---------------------------------------
+    # --- Sequential
+    # ---------------------------------------
+    opt = buildPolynomialProblem(number_of_samples=100000)
+    opt.startOptimization()
+    xf = opt.xf
+
+    # ---------------------------------------
+    # --- Worker pool
+    # ---------------------------------------
+    opt = buildPolynomialProblem(number_of_samples=100000)
+    polynomial = opt.data_models['polynomial']
+    polynomial.xs = opt.shareArray(polynomial.xs)  # before the pool is started, the workers keep a snapshot
+    polynomial.ys = opt.shareArray(polynomial.ys)
+
+    opt.startWorkerPool(number_of_workers=2)
+    opt.startOptimization()
+    print('Coefficients without workers: ' + str(xf))
+    print('Coefficients with workers:    ' + str(opt.xf))
+    assert np.allclose(opt.xf, xf)
+
+    # evaluate the cost of several starting points in parallel, e.g. to pick the best one
+    starting_points = [np.random.RandomState(seed).uniform(-5, 5, 4) for seed in range(8)]
+    costs = 0.5 * np.sum(opt.evaluateInParallel(starting_points) ** 2, axis=1)
+    print('Costs of the starting points: ' + str(costs))
+
+    opt.stopWorkerPool()
+    opt.releaseSharedArrays()
@@ -214,24 +214,13 @@ if __name__ == "__main__":
     #     elif i == 5:
     #         return [sensorTransforms.r[2]]
 
-    def getterTranslation(models, i):
-        return models[i].t
+    def getterPose(models, i):
+        return tf.compose_matrix(angles=models[i].r, translate=models[i].t)
 
 
-    def getterRotation(models, i):
-        return models[i].r
-
-
-    def setterTranslation(models, values, i):
-        models[i].t[0] = values[0]
-        models[i].t[1] = values[1]
-        models[i].t[2] = values[2]
-
-
-    def setterRotation(models, values, i):
-        models[i].r[0] = values[0]
-        models[i].r[1] = values[1]
-        models[i].r[2] = values[2]
+    def setterPose(models, matrix, i):
+        models[i].t = list(matrix[0:3, 3])
+        models[i].r = list(tf.euler_from_matrix(matrix))
 
 
     # def getterSensorRotation(data, sensor_key, collection_key):
@@ -263,30 +252,15 @@ if __name__ == "__main__":
     #         data['collections'][_collection_key]['transforms'][transform_key]['quat'] = quat
 
 
+    # pose groups, the rotation is updated locally by the optimizer instead of optimizing the euler angles
     for i, model in enumerate(models):
-        if i == 0:
-            # to fix model_0 as reference model, no POS change
-            bound_max_t = model.t + np.finfo(np.float32).eps
-            bound_min_t = model.t - np.finfo(np.float32).eps
-            bound_max_r = model.r + np.finfo(np.float32).eps
-            bound_min_r = model.r - np.finfo(np.float32).eps
-        else:
-            bound_max_t = None
-            bound_min_t = None
-            bound_max_r = None
-            bound_min_r = None
-
-        opt.pushParamVector(group_name='model' + str(i) + '_t', data_key='models',
-                            getter=partial(getterTranslation, i=i),
-                            setter=partial(setterTranslation, i=i),
-                            suffix=['x', 'y', 'z'],
-                            bound_max=bound_max_t, bound_min=bound_min_t)
-
-        opt.pushParamVector(group_name='model' + str(i) + '_r', data_key='models',
-                            getter=partial(getterRotation, i=i),
-                            setter=partial(setterRotation, i=i),
-                            suffix=['x', 'y', 'z'],
-                            bound_max=bound_max_r, bound_min=bound_min_r)
+        opt.pushParamPose(group_name='model' + str(i), data_key='models',
+                          getter=partial(getterPose, i=i),
+                          setter=partial(setterPose, i=i),
+                          suffix=['_tx', '_ty', '_tz', '_rx', '_ry', '_rz'])
+
+    # to fix model_0 as reference model, no POS change
+    opt.setGroupFixed('model0')
 
     opt.printParameters()
 
@@ -308,6 +282,13 @@ if __name__ == "__main__":
     # ---------------------------------------
     # --- Define THE OBJECTIVE FUNCTION
     # ---------------------------------------
+    # preallocated buffers for the transformed clouds of each pair, reused in every evaluation. Each pair has its own
+    # buffers, sized from its clouds, so the pairs may be evaluated concurrently
+    buffers = {}
+    for model_a, model_b in combinations(models, 2):
+        buffers[(model_a.name, model_b.name)] = (np.empty((len(model_a.cloud.points), 3)),
+                                                 np.empty((len(model_b.cloud.points), 3)))
+
     def objectiveFunction(models):
 
         models = models['models']
@@ -326,14 +307,13 @@ if __name__ == "__main__":
             # model_a = c[0]
             # model_b = c[1]
             print("Iteration: " + str(count) + ": " + str(model_a) + ' with ' + str(model_b))
+            buffer_a, buffer_b = buffers[(model_a.name, model_b.name)]
 
             trans_a = np.array([model_a.t[0], model_a.t[1], model_a.t[2]])
             angle_a = np.array([model_a.r[0], model_a.r[1], model_a.r[2]])
             tfa = tf.compose_matrix(scale=None, shear=None, angles=angle_a, translate=trans_a, perspective=None)
 
-            temp_a = cp.deepcopy(model_a.cloud)
-            temp_a.transform(tfa)
-            targetpts = np.array(temp_a.points)
+            targetpts = tf.transform_points(tfa, np.asarray(model_a.cloud.points), out=buffer_a)
 
             # v = cp.deepcopy(noisy_cloud)
             # # y = (noisy_cloud)
@@ -344,15 +324,10 @@ if __name__ == "__main__":
             angle_b = np.array([model_b.r[0], model_b.r[1], model_b.r[2]])
             tfb = tf.compose_matrix(scale=None, shear=None, angles=angle_b, translate=trans_b, perspective=None)
             
-            temp_b = cp.deepcopy(model_b.cloud)
-            temp_b.transform(tfb)
-            sourcepts = np.array(temp_b.points)
+            sourcepts = tf.transform_points(tfb, np.asarray(model_b.cloud.points), out=buffer_b)
 
             #compute error between points in transformed target and source (append or add!?)
-            for i in np.arange(0,len(sourcepts)):
-                error.append( (sourcepts[i][0] - targetpts[i][0]) * (sourcepts[i][0] - targetpts[i][0])
-                            + (sourcepts[i][1] - targetpts[i][1]) * (sourcepts[i][1] - targetpts[i][1])
-                            + (sourcepts[i][2] - targetpts[i][2]) * (sourcepts[i][2] - targetpts[i][2]))
+            error.extend(np.sum((sourcepts - targetpts) ** 2, axis=1))
 
         print("first 5 errors = " + str(error[0:5]))
         return error   
@@ -379,12 +354,12 @@ if __name__ == "__main__":
 
         N = len(model_a.cloud.points)
 
-        params = opt.getParamsContainingPattern('model' + str(model_a.name) + '_')  # for model a
-        params.extend(opt.getParamsContainingPattern('model' +str(model_b.name) + '_'))  # for model b
+        params = opt.getParamsWithPrefix('model' + str(model_a.name) + '_')  # for model a
+        params.extend(opt.getParamsWithPrefix('model' + str(model_b.name) + '_'))  # for model b
 
-        for n in range(0, N):
-            residual_name = 'r_' + model_a.name + '_' + model_b.name + '_' + str(n)
-            opt.pushResidual(name=residual_name, params=params)
+        # a single block of residuals r_a_b_0, ..., r_a_b_N-1 which depend on the same params
+        opt.pushResidualBlock(name_template='r_' + model_a.name + '_' + model_b.name + '_{}', number_of_residuals=N,
+                              params=params)
 
     opt.printResiduals()
 
@@ -403,7 +378,7 @@ if __name__ == "__main__":
     #     # for a in range(0, 1):
     #     #     opt.pushResidual(name='cloud' + str(a), params=['t', 'r'])
 
-    print('residuals = ' + str(opt.residuals))
+    print('residual blocks = ' + str(list(opt.residual_blocks.keys())))
     opt.computeSparseMatrix()
     # ---------------------------------------
     # --- Define THE VISUALIZATION FUNCTION